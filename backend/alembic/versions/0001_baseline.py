@@ -0,0 +1,133 @@
+"""Baseline schema
+
+Revision ID: 0001
+Revises:
+Create Date: 2026-10-17
+
+Creates the schema as it stood when migrations were introduced. Databases
+created earlier by `Base.metadata.create_all` plus the ad-hoc ALTERs in
+`main.startup` are adopted instead: the missing columns are added in place.
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+revision = "0001"
+down_revision = None
+branch_labels = None
+depends_on = None
+
+# The statements main.startup used to run on every boot
+LEGACY_ALTERS = (
+    "ALTER TABLE images ADD COLUMN IF NOT EXISTS room_id UUID REFERENCES rooms(id)",
+    "ALTER TABLE jobs ADD COLUMN IF NOT EXISTS room_id UUID REFERENCES rooms(id)",
+    "ALTER TABLE jobs ADD COLUMN IF NOT EXISTS analysis VARCHAR",
+    "ALTER TABLE jobs ADD COLUMN IF NOT EXISTS placement_plan VARCHAR",
+    "ALTER TABLE jobs ADD COLUMN IF NOT EXISTS generation_prompt VARCHAR",
+    "ALTER TABLE jobs ADD COLUMN IF NOT EXISTS model VARCHAR DEFAULT 'v2'",
+    "ALTER TABLE images ADD COLUMN IF NOT EXISTS content_hash VARCHAR",
+    "ALTER TABLE images ADD COLUMN IF NOT EXISTS orientation INTEGER",
+    "ALTER TABLE images ADD COLUMN IF NOT EXISTS phash VARCHAR",
+    "ALTER TABLE images ADD COLUMN IF NOT EXISTS model_input_url VARCHAR",
+    "ALTER TABLE images ADD COLUMN IF NOT EXISTS thumbnails JSON",
+    "ALTER TABLE jobs ADD COLUMN IF NOT EXISTS thumbnails JSON",
+)
+
+
+def upgrade():
+    if sa.inspect(op.get_bind()).has_table("jobs"):
+        for statement in LEGACY_ALTERS:
+            op.execute(statement)
+        return
+
+    op.create_table(
+        "users",
+        sa.Column("id", postgresql.UUID(as_uuid=True), primary_key=True),
+        sa.Column("email", sa.String(), nullable=False),
+        sa.Column("hashed_password", sa.String(), nullable=False),
+        sa.Column("credits_remaining", sa.Integer(), nullable=True),
+        sa.Column("created_at", sa.DateTime(), nullable=True),
+        sa.Column("last_login", sa.DateTime(), nullable=True),
+    )
+    op.create_index("ix_users_email", "users", ["email"], unique=True)
+
+    op.create_table(
+        "properties",
+        sa.Column("id", postgresql.UUID(as_uuid=True), primary_key=True),
+        sa.Column("user_id", postgresql.UUID(as_uuid=True), sa.ForeignKey("users.id"), nullable=False),
+        sa.Column("name", sa.String(), nullable=False),
+        sa.Column("address", sa.String(), nullable=True),
+        sa.Column("created_at", sa.DateTime(), nullable=True),
+    )
+
+    # rooms and images reference each other; the rooms -> images key is added once both exist
+    op.create_table(
+        "rooms",
+        sa.Column("id", postgresql.UUID(as_uuid=True), primary_key=True),
+        sa.Column("property_id", postgresql.UUID(as_uuid=True), sa.ForeignKey("properties.id"), nullable=False),
+        sa.Column("name", sa.String(), nullable=False),
+        sa.Column("room_type", sa.String(), nullable=False),
+        sa.Column("reference_image_id", postgresql.UUID(as_uuid=True), nullable=True),
+        sa.Column("created_at", sa.DateTime(), nullable=True),
+    )
+
+    op.create_table(
+        "images",
+        sa.Column("id", postgresql.UUID(as_uuid=True), primary_key=True),
+        sa.Column("user_id", postgresql.UUID(as_uuid=True), sa.ForeignKey("users.id"), nullable=False),
+        sa.Column("room_id", postgresql.UUID(as_uuid=True), sa.ForeignKey("rooms.id"), nullable=True),
+        sa.Column("original_filename", sa.String(), nullable=False),
+        sa.Column("original_url", sa.String(), nullable=False),
+        sa.Column("room_type", sa.String(), nullable=True),
+        sa.Column("width", sa.Integer(), nullable=True),
+        sa.Column("height", sa.Integer(), nullable=True),
+        sa.Column("file_size", sa.Integer(), nullable=True),
+        sa.Column("format", sa.String(), nullable=True),
+        sa.Column("orientation", sa.Integer(), nullable=True),
+        sa.Column("content_hash", sa.String(), nullable=True),
+        sa.Column("phash", sa.String(), nullable=True),
+        sa.Column("model_input_url", sa.String(), nullable=True),
+        sa.Column("thumbnails", sa.JSON(), nullable=True),
+        sa.Column("created_at", sa.DateTime(), nullable=True),
+    )
+    op.create_foreign_key(
+        "rooms_reference_image_id_fkey", "rooms", "images", ["reference_image_id"], ["id"]
+    )
+
+    op.create_table(
+        "jobs",
+        sa.Column("id", postgresql.UUID(as_uuid=True), primary_key=True),
+        sa.Column("user_id", postgresql.UUID(as_uuid=True), sa.ForeignKey("users.id"), nullable=False),
+        sa.Column("image_id", postgresql.UUID(as_uuid=True), sa.ForeignKey("images.id"), nullable=False),
+        sa.Column("room_id", postgresql.UUID(as_uuid=True), sa.ForeignKey("rooms.id"), nullable=True),
+        sa.Column("room_type", sa.String(), nullable=False),
+        sa.Column("style_preset", sa.String(), nullable=False),
+        sa.Column("model", sa.String(), nullable=True, server_default="v2"),
+        sa.Column("fix_white_balance", sa.Boolean(), nullable=True),
+        sa.Column("wall_decorations", sa.Boolean(), nullable=True),
+        sa.Column("include_tv", sa.Boolean(), nullable=True),
+        sa.Column("status", sa.String(), nullable=True),
+        sa.Column("retry_count", sa.Integer(), nullable=True),
+        sa.Column("error_message", sa.String(), nullable=True),
+        sa.Column("progress_percent", sa.Float(), nullable=True),
+        sa.Column("current_step", sa.String(), nullable=True),
+        sa.Column("generation_time_seconds", sa.Integer(), nullable=True),
+        sa.Column("created_at", sa.DateTime(), nullable=True),
+        sa.Column("started_at", sa.DateTime(), nullable=True),
+        sa.Column("completed_at", sa.DateTime(), nullable=True),
+        sa.Column("result_url", sa.String(), nullable=True),
+        sa.Column("thumbnails", sa.JSON(), nullable=True),
+        sa.Column("analysis", sa.String(), nullable=True),
+        sa.Column("placement_plan", sa.String(), nullable=True),
+        sa.Column("generation_prompt", sa.String(), nullable=True),
+    )
+
+
+def downgrade():
+    op.drop_table("jobs")
+    op.drop_constraint("rooms_reference_image_id_fkey", "rooms", type_="foreignkey")
+    op.drop_table("images")
+    op.drop_table("rooms")
+    op.drop_table("properties")
+    op.drop_index("ix_users_email", table_name="users")
+    op.drop_table("users")
@@ -0,0 +1,49 @@
+"""Indexes for the hot query paths
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-17
+
+Each index matches a query the API or the worker runs on every request/job:
+
+- jobs (image_id, status, created_at): latest completed job of the room's
+  reference image (generation._find_reference), Image.jobs selectin loads
+  and job deletion by image.
+- jobs (created_at, id), (user_id|room_id|status, created_at, id): keyset
+  pagination of GET /jobs, unfiltered and per filter.
+- images (room_id, created_at): Room.images loads and the fallback
+  reference (oldest remaining image) when a reference image is deleted.
+- rooms (property_id), rooms (reference_image_id), properties (user_id):
+  property/room listings and reference-image lookups.
+
+The two pagination indexes were previously created by main.startup, hence
+if_not_exists.
+"""
+from alembic import op
+
+revision = "0002"
+down_revision = "0001"
+branch_labels = None
+depends_on = None
+
+INDEXES = (
+    ("ix_jobs_image_id_status_created_at", "jobs", ["image_id", "status", "created_at"]),
+    ("ix_jobs_created_at_id", "jobs", ["created_at", "id"]),
+    ("ix_jobs_user_id_created_at_id", "jobs", ["user_id", "created_at", "id"]),
+    ("ix_jobs_room_id_created_at_id", "jobs", ["room_id", "created_at", "id"]),
+    ("ix_jobs_status_created_at_id", "jobs", ["status", "created_at", "id"]),
+    ("ix_images_room_id_created_at", "images", ["room_id", "created_at"]),
+    ("ix_rooms_property_id", "rooms", ["property_id"]),
+    ("ix_rooms_reference_image_id", "rooms", ["reference_image_id"]),
+    ("ix_properties_user_id", "properties", ["user_id"]),
+)
+
+
+def upgrade():
+    for name, table, columns in INDEXES:
+        op.create_index(name, table, columns, if_not_exists=True)
+
+
+def downgrade():
+    for name, table, _ in reversed(INDEXES):
+        op.drop_index(name, table_name=table, if_exists=True)
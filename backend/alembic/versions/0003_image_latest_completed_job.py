@@ -0,0 +1,51 @@
+"""Materialized latest completed job per image
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-17
+
+Adds images.latest_completed_job_id so property and room views load one job
+per image instead of every job the image ever had. Backfilled with
+DISTINCT ON over the (image_id, status, created_at) index from 0002.
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+revision = "0003"
+down_revision = "0002"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column(
+        "images",
+        sa.Column("latest_completed_job_id", postgresql.UUID(as_uuid=True), nullable=True),
+    )
+    op.create_foreign_key(
+        "images_latest_completed_job_id_fkey",
+        "images",
+        "jobs",
+        ["latest_completed_job_id"],
+        ["id"],
+        ondelete="SET NULL",
+    )
+    op.execute(
+        """
+        UPDATE images
+        SET latest_completed_job_id = latest.id
+        FROM (
+            SELECT DISTINCT ON (image_id) image_id, id
+            FROM jobs
+            WHERE status = 'completed' AND result_url IS NOT NULL
+            ORDER BY image_id, created_at DESC
+        ) AS latest
+        WHERE images.id = latest.image_id
+        """
+    )
+
+
+def downgrade():
+    op.drop_constraint("images_latest_completed_job_id_fkey", "images", type_="foreignkey")
+    op.drop_column("images", "latest_completed_job_id")
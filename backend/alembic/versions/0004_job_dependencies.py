@@ -0,0 +1,40 @@
+"""Job dependencies
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2026-10-17
+
+Adds jobs.depends_on_job_id so a room's other angles record that they wait
+for the reference image job. Indexed because deleting a job nulls the
+column on its dependents through the foreign key.
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+revision = "0004"
+down_revision = "0003"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column(
+        "jobs",
+        sa.Column("depends_on_job_id", postgresql.UUID(as_uuid=True), nullable=True),
+    )
+    op.create_foreign_key(
+        "jobs_depends_on_job_id_fkey",
+        "jobs",
+        "jobs",
+        ["depends_on_job_id"],
+        ["id"],
+        ondelete="SET NULL",
+    )
+    op.create_index("ix_jobs_depends_on_job_id", "jobs", ["depends_on_job_id"])
+
+
+def downgrade():
+    op.drop_index("ix_jobs_depends_on_job_id", table_name="jobs")
+    op.drop_constraint("jobs_depends_on_job_id_fkey", "jobs", type_="foreignkey")
+    op.drop_column("jobs", "depends_on_job_id")
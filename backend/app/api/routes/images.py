@@ -1,17 +1,38 @@
-from fastapi import APIRouter, UploadFile, File, Depends, HTTPException
+from fastapi import APIRouter, BackgroundTasks, Request, Depends, HTTPException
 from sqlalchemy.ext.asyncio import AsyncSession
 from app.models.base import get_db
 from app.models.image import Image
 from app.schemas.image import ImageRead, ImageRead
 from app.services.storage import storage_service
+from app.services.uploads import stream_image_upload
+from app.services.image_processing import process_uploaded_image, delete_image_derivatives
+from app.services.response_cache import bump_room_version
 from app.core.config import settings
 import uuid
 
 router = APIRouter()
 
-@router.post("/upload", response_model=ImageRead)
+@router.post(
+    "/upload",
+    response_model=ImageRead,
+    openapi_extra={
+        "requestBody": {
+            "required": True,
+            "content": {
+                "multipart/form-data": {
+                    "schema": {
+                        "type": "object",
+                        "properties": {"file": {"type": "string", "format": "binary"}},
+                        "required": ["file"],
+                    }
+                }
+            },
+        }
+    },
+)
 async def upload_image(
-    file: UploadFile = File(...),
+    request: Request,
+    background_tasks: BackgroundTasks,
     room_id: uuid.UUID = None,
     db: AsyncSession = Depends(get_db)
 ):
@@ -19,25 +40,30 @@ async def upload_image(
     # In a real app, this would come from auth
     user_id = uuid.UUID(settings.DEFAULT_USER_ID)
     
-    file_content = await file.read()
-    file_extension = file.filename.split(".")[-1]
-    object_name = f"{uuid.uuid4()}.{file_extension}"
-    
-    url = await storage_service.upload_file(
-        settings.BUCKET_UPLOADS,
-        object_name,
-        file_content,
-        file.content_type
-    )
+    # Stream the body straight into storage instead of buffering the whole file
+    try:
+        upload = await stream_image_upload(request, settings.BUCKET_UPLOADS)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    if room_id is None and upload.fields.get("room_id"):
+        try:
+            room_id = uuid.UUID(upload.fields["room_id"])
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid room_id")
     
     db_image = Image(
         id=uuid.uuid4(),
         user_id=user_id,
         room_id=room_id,
-        original_filename=file.filename,
-        original_url=url,
-        file_size=len(file_content),
-        format=file.content_type
+        original_filename=upload.filename,
+        original_url=upload.url,
+        width=upload.width,
+        height=upload.height,
+        orientation=upload.orientation,
+        file_size=upload.size,
+        content_hash=upload.content_hash,
+        format=upload.image_format or upload.content_type
     )
     
     db.add(db_image)
@@ -53,6 +79,10 @@ async def upload_image(
             db.add(db_room)
     await db.commit()
     await db.refresh(db_image)
+    await bump_room_version(db, room_id)
+
+    # Perceptual hash and model-ready derivatives need pixels; build them after the response is sent
+    background_tasks.add_task(process_uploaded_image, db_image.id)
     
     return db_image
 
@@ -105,13 +135,20 @@ async def delete_image(image_id: uuid.UUID, db: AsyncSession = Depends(get_db)):
             await storage_service.delete_file(settings.BUCKET_UPLOADS, object_name)
         except Exception as e:
             print(f"Error deleting original from storage: {e}")
+    await delete_image_derivatives(db_image)
 
     # Delete the image record (this will also delete associated jobs if cascade is set, or we should handle it)
     from app.models.job import Job
     # Delete associated jobs first to avoid foreign key issues
-    await db.execute(delete(Job).where(Job.image_id == image_id))
+    deleted_jobs = await db.execute(delete(Job).where(Job.image_id == image_id).returning(Job.id))
+    deleted_job_ids = deleted_jobs.scalars().all()
     
     await db.delete(db_image)
     await db.commit()
 
+    from app.services.job_events import forget_job
+    for job_id in deleted_job_ids:
+        await forget_job(str(job_id))
+    await bump_room_version(db, room_id)
+
     return {"message": "Image deleted successfully"}
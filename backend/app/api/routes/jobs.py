@@ -1,11 +1,14 @@
-from fastapi import APIRouter, Depends, HTTPException
-from fastapi.responses import Response
+from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.responses import Response, StreamingResponse
 from sqlalchemy.ext.asyncio import AsyncSession
 from app.models.base import get_db
 from app.models.job import Job
-from app.schemas.job import JobCreate, JobRead, JobList
+from app.schemas.job import JobBatchCreate, JobBatchRead, JobCreate, JobRead, JobList, QueueMetrics
 from app.core.config import settings
-from app.services.worker import queue_staging_job
+from app.services.job_queue import enqueue_many, queue_metrics, queue_staging_job
+from datetime import datetime, timedelta
+from typing import Optional
+import base64
 import uuid
 
 router = APIRouter()
@@ -45,6 +48,35 @@ async def test_generate():
     )
     return Response(content=image_bytes, media_type="image/jpeg")
 
+async def _pending_reference_job(db: AsyncSession, room_id, image_id) -> Optional[uuid.UUID]:
+    """
+    The queued or running job of the room's reference image, if any, which a
+    job for another angle of the room must wait for to inherit its plan. Only
+    jobs created or started within STAGING_JOB_TIMEOUT_SECONDS count: older
+    rows still marked queued or in_progress are presumed lost.
+    """
+    from sqlalchemy import func, select
+    from app.models.image import Image
+    from app.models.room import Room
+
+    if room_id is None:
+        return None
+    recent = datetime.utcnow() - timedelta(seconds=settings.STAGING_JOB_TIMEOUT_SECONDS)
+    stmt = (
+        select(Job.id)
+        .join(Image, Image.id == Job.image_id)
+        .join(Room, Room.reference_image_id == Image.id)
+        .where(
+            Room.id == room_id,
+            Image.id != image_id,
+            Job.status.in_(("queued", "in_progress")),
+            func.coalesce(Job.started_at, Job.created_at) >= recent,
+        )
+        .order_by(Job.created_at.desc())
+        .limit(1)
+    )
+    return (await db.execute(stmt)).scalar_one_or_none()
+
 @router.post("/", response_model=JobRead)
 async def create_job(
     job_in: JobCreate,
@@ -66,6 +98,7 @@ async def create_job(
         wall_decorations=job_in.wall_decorations,
         include_tv=job_in.include_tv,
         room_id=job_in.room_id,
+        depends_on_job_id=await _pending_reference_job(db, job_in.room_id, job_in.image_id),
         status="queued"
     )
     
@@ -74,45 +107,259 @@ async def create_job(
     await db.refresh(db_job)
     
     
-    # Queue the job
-    queue_staging_job(str(db_job.id))
+    # Queue the job, behind the room's reference job while that one is still running
+    if db_job.depends_on_job_id:
+        await enqueue_many(
+            [str(db_job.id)], user_id, lane="interactive", depends_on=str(db_job.depends_on_job_id)
+        )
+    else:
+        await queue_staging_job(str(db_job.id), user_id)
     
     return db_job
 
+@router.post("/batch", response_model=JobBatchRead)
+async def create_batch_jobs(
+    batch_in: JobBatchCreate,
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    Creates staging jobs for all images of a room or property in one
+    transaction, queued in the bulk lane. In each room the reference image is
+    staged first; the other angles wait for it and then run in parallel,
+    inheriting its plan.
+    """
+    from sqlalchemy import select
+    from sqlalchemy.orm import selectinload
+    from app.models.room import Room
+
+    if (batch_in.room_id is None) == (batch_in.property_id is None):
+        raise HTTPException(status_code=400, detail="Provide exactly one of room_id or property_id")
+
+    user_id = uuid.UUID(settings.DEFAULT_USER_ID)
+    stmt = select(Room).options(selectinload(Room.images))
+    if batch_in.room_id:
+        stmt = stmt.where(Room.id == batch_in.room_id)
+    else:
+        stmt = stmt.where(Room.property_id == batch_in.property_id)
+    rooms = (await db.execute(stmt)).scalars().all()
+    if not rooms:
+        raise HTTPException(status_code=404, detail="Room or property not found")
+
+    selected = set(batch_in.image_ids) if batch_in.image_ids else None
+    jobs = []
+    schedule = []  # (reference job id or None, its job if created in this batch, dependent jobs) per room
+    for room in rooms:
+        reference_job = None
+        dependents = []
+        for image in room.images:
+            if selected is not None and image.id not in selected:
+                continue
+            db_job = Job(
+                id=uuid.uuid4(),
+                user_id=user_id,
+                image_id=image.id,
+                room_id=room.id,
+                room_type=room.room_type,
+                style_preset=batch_in.style_preset,
+                model=batch_in.model,
+                fix_white_balance=batch_in.fix_white_balance,
+                wall_decorations=batch_in.wall_decorations,
+                include_tv=batch_in.include_tv,
+                status="queued"
+            )
+            jobs.append(db_job)
+            if image.id == room.reference_image_id:
+                reference_job = db_job
+            else:
+                dependents.append(db_job)
+
+        # Without the reference image in the batch, wait for one already running
+        reference_job_id = reference_job.id if reference_job else None
+        if reference_job_id is None and dependents:
+            reference_job_id = await _pending_reference_job(db, room.id, None)
+        for db_job in dependents:
+            db_job.depends_on_job_id = reference_job_id
+        schedule.append((reference_job_id, reference_job, dependents))
+
+    if not jobs:
+        raise HTTPException(status_code=400, detail="No images to stage")
+
+    db.add_all(jobs)
+    await db.commit()
+
+    for reference_job_id, reference_job, dependents in schedule:
+        dependent_ids = [str(db_job.id) for db_job in dependents]
+        if reference_job_id:
+            await enqueue_many(dependent_ids, user_id, depends_on=str(reference_job_id))
+        else:
+            await enqueue_many(dependent_ids, user_id)
+        if reference_job:
+            await queue_staging_job(str(reference_job.id), user_id, lane="bulk")
+
+    return {"jobs": jobs}
+
+# Columns exposed by JobRead. Status reads never load the multi-kilobyte
+# analysis / placement_plan / generation_prompt text columns.
+_JOB_READ_COLUMNS = (
+    Job.id, Job.user_id, Job.image_id, Job.room_id, Job.room_type, Job.style_preset, Job.model,
+    Job.fix_white_balance, Job.wall_decorations, Job.include_tv, Job.status, Job.depends_on_job_id,
+    Job.retry_count, Job.progress_percent,
+    Job.current_step, Job.error_message, Job.result_url, Job.thumbnails,
+    Job.created_at, Job.started_at, Job.completed_at,
+)
+
+async def _get_job_status_dict(db: AsyncSession, job_id: uuid.UUID) -> dict:
+    """
+    Current status of a job as a JobRead dict. Served from the Redis status
+    cache the worker keeps up to date; the database is only read (column
+    projection, no LLM text) when the job is not cached yet.
+    """
+    from sqlalchemy import select
+    from app.models.image import Image
+    from app.services.job_events import get_job_snapshot, seed_job_snapshot
+
+    cached = await get_job_snapshot(str(job_id))
+    if cached is not None:
+        return cached
+
+    stmt = (
+        select(
+            *_JOB_READ_COLUMNS,
+            Image.original_url.label("original_image_url"),
+            Image.thumbnails.label("original_image_thumbnails"),
+        )
+        .join(Image, Job.image_id == Image.id)
+        .where(Job.id == job_id)
+    )
+    row = (await db.execute(stmt)).one_or_none()
+    if not row:
+        raise HTTPException(status_code=404, detail="Job not found")
+
+    job_dict = dict(row._mapping)
+    await seed_job_snapshot(str(job_id), job_dict)
+    return job_dict
+
+def _encode_cursor(created_at: datetime, job_id: uuid.UUID) -> str:
+    raw = f"{created_at.isoformat()}|{job_id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+def _decode_cursor(cursor: str) -> tuple[datetime, uuid.UUID]:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        created_at, job_id = base64.urlsafe_b64decode(padded).decode().split("|", 1)
+        return datetime.fromisoformat(created_at), uuid.UUID(job_id)
+    except (ValueError, UnicodeDecodeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
 @router.get("/", response_model=JobList)
 async def list_jobs(
+    limit: int = Query(settings.JOBS_PAGE_SIZE, ge=1, le=settings.JOBS_PAGE_MAX_SIZE),
+    cursor: Optional[str] = Query(None, description="next_cursor of the previous page"),
+    status: Optional[str] = None,
+    room_id: Optional[uuid.UUID] = None,
+    image_id: Optional[uuid.UUID] = None,
+    user_id: Optional[uuid.UUID] = None,
     db: AsyncSession = Depends(get_db)
 ):
-    from sqlalchemy import select
-    result = await db.execute(select(Job).order_by(Job.created_at.desc()))
+    """
+    Jobs newest first, paginated by keyset on (created_at, id) so every page
+    is an index range scan regardless of how deep the client has paged.
+    """
+    from sqlalchemy import select, tuple_
+    from sqlalchemy.orm import load_only
+
+    stmt = select(Job).options(load_only(*_JOB_READ_COLUMNS))
+    if status:
+        stmt = stmt.where(Job.status == status)
+    if room_id:
+        stmt = stmt.where(Job.room_id == room_id)
+    if image_id:
+        stmt = stmt.where(Job.image_id == image_id)
+    if user_id:
+        stmt = stmt.where(Job.user_id == user_id)
+    if cursor:
+        stmt = stmt.where(tuple_(Job.created_at, Job.id) < tuple_(*_decode_cursor(cursor)))
+
+    # Fetch one extra row to know whether another page exists
+    stmt = stmt.order_by(Job.created_at.desc(), Job.id.desc()).limit(limit + 1)
+    result = await db.execute(stmt)
     jobs = result.scalars().all()
-    return {"jobs": jobs}
+
+    next_cursor = None
+    if len(jobs) > limit:
+        jobs = jobs[:limit]
+        next_cursor = _encode_cursor(jobs[-1].created_at, jobs[-1].id)
+    return {"jobs": jobs, "next_cursor": next_cursor}
+
+@router.get("/queue", response_model=QueueMetrics)
+async def get_queue_metrics():
+    """Staging queue depth per lane and recent queue wait times, read from Redis only."""
+    return await queue_metrics()
 
 @router.get("/{job_id}", response_model=JobRead)
 async def get_job_status(
     job_id: uuid.UUID,
     db: AsyncSession = Depends(get_db)
 ):
-    # Status endpoint for polling
-    from sqlalchemy import select
-    from app.models.image import Image
-    
-    # query to join job and image to get the original url
-    stmt = select(Job, Image).join(Image, Job.image_id == Image.id).where(Job.id == job_id)
-    result = await db.execute(stmt)
-    record = result.one_or_none()
-    
-    if not record:
-        raise HTTPException(status_code=404, detail="Job not found")
-        
-    job, image = record
-    
-    # We need to convert the SQLAlchemy model to the Pydantic schema
-    # but manually inject the original_image_url
-    job_dict = {c.name: getattr(job, c.name) for c in job.__table__.columns}
-    job_dict['original_image_url'] = image.original_url
-    
-    return job_dict
+    # Status endpoint for polling: a single Redis read once the job is cached
+    return await _get_job_status_dict(db, job_id)
+
+@router.get("/{job_id}/events")
+async def stream_job_events(
+    job_id: uuid.UUID,
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    Server-Sent Events stream of a job's progress, pushed from the worker via
+    Redis pub/sub. Replaces polling GET /jobs/{job_id}; the database is only
+    read when Redis holds no snapshot for the job yet.
+    """
+    from app.services.job_events import job_event_stream
+
+    snapshot = await _get_job_status_dict(db, job_id)
+    return StreamingResponse(
+        job_event_stream(str(job_id), snapshot),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+@router.post("/{job_id}/retry", response_model=JobRead)
+async def retry_job(
+    job_id: uuid.UUID,
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    Requeues a failed job with a fresh retry budget. The worker resumes it at
+    the first stage without a saved output, so LLM stages that already
+    succeeded (analysis, placement plan, prompt) are not run again.
+    """
+    from sqlalchemy import select, update
+    from app.services.job_events import publish_job_event
+
+    stmt = (
+        update(Job)
+        .where(Job.id == job_id, Job.status == "error")
+        .values(
+            status="queued",
+            error_message=None,
+            retry_count=0,
+            progress_percent=0.0,
+            current_step=None,
+            completed_at=None,
+        )
+        .returning(Job.user_id)
+        .execution_options(synchronize_session=False)
+    )
+    user_id = (await db.execute(stmt)).scalar_one_or_none()
+    if user_id is None:
+        if (await db.execute(select(Job.id).where(Job.id == job_id))).scalar_one_or_none() is None:
+            raise HTTPException(status_code=404, detail="Job not found")
+        raise HTTPException(status_code=409, detail="Only failed jobs can be retried")
+    await db.commit()
+
+    await publish_job_event(str(job_id), error_message=None, completed_at=None, retry_count=0)
+    await queue_staging_job(str(job_id), user_id)
+    return await _get_job_status_dict(db, job_id)
 
 @router.delete("/{job_id}")
 async def delete_job(
@@ -120,10 +367,23 @@ async def delete_job(
     db: AsyncSession = Depends(get_db)
 ):
     from sqlalchemy import delete
-    result = await db.execute(delete(Job).where(Job.id == job_id))
-    await db.commit()
-    
-    if result.rowcount == 0:
+    from app.services.image_results import refresh_latest_completed_job
+    result = await db.execute(delete(Job).where(Job.id == job_id).returning(Job.image_id))
+    image_id = result.scalar_one_or_none()
+    if image_id is None:
         raise HTTPException(status_code=404, detail="Job not found")
+
+    # The FK nulls the image's pointer if this was its latest result; fall back to the previous one
+    await refresh_latest_completed_job(db, image_id)
+    await db.commit()
+
+    from sqlalchemy import select
+    from app.models.image import Image
+    from app.services.response_cache import bump_room_version
+    room_id = (await db.execute(select(Image.room_id).where(Image.id == image_id))).scalar_one_or_none()
+    await bump_room_version(db, room_id)
+
+    from app.services.job_events import forget_job
+    await forget_job(str(job_id))
         
     return {"message": "Job deleted successfully"}
@@ -1,4 +1,4 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Request
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select
 from app.models.base import get_db
@@ -6,11 +6,37 @@ from app.models.property import Property
 from app.models.room import Room
 from app.schemas.property import PropertyCreate, PropertyRead, PropertyWithRooms, RoomCreate, RoomRead
 from app.core.config import settings
+from app.services.response_cache import (
+    bump_property_version,
+    cached_response,
+    get_property_version,
+    room_property_id,
+)
 import uuid
 from typing import List
 
 router = APIRouter()
 
+def _populate_latest_result(img):
+    """Copies the result and settings of the image's latest completed job onto it for ImageRead."""
+    latest_job = img.latest_completed_job
+    if latest_job:
+        img.latest_result_url = latest_job.result_url
+        img.latest_result_thumbnails = latest_job.thumbnails
+        img.latest_settings = {
+            "style_preset": latest_job.style_preset,
+            "fix_white_balance": latest_job.fix_white_balance,
+            "wall_decorations": latest_job.wall_decorations,
+            "include_tv": latest_job.include_tv
+        }
+
+def _latest_completed_job_columns():
+    from app.models.job import Job
+    return (
+        Job.result_url, Job.thumbnails, Job.style_preset,
+        Job.fix_white_balance, Job.wall_decorations, Job.include_tv,
+    )
+
 @router.get("", response_model=List[PropertyRead])
 async def list_properties(db: AsyncSession = Depends(get_db)):
     user_id = uuid.UUID(settings.DEFAULT_USER_ID)
@@ -32,40 +58,35 @@ async def create_property(prop: PropertyCreate, db: AsyncSession = Depends(get_d
     return db_prop
 
 @router.get("/{property_id}", response_model=PropertyWithRooms)
-async def get_property(property_id: uuid.UUID, db: AsyncSession = Depends(get_db)):
-    result = await db.execute(select(Property).where(Property.id == property_id))
-    db_prop = result.scalar_one_or_none()
-    if not db_prop:
-        raise HTTPException(status_code=404, detail="Property not found")
-    
-    # SQLAlchemy will handle the rooms relationship if eager loaded or accessed
-    # For async we must use selectinload for nested relationships
-    from sqlalchemy.orm import selectinload
-    from app.models.image import Image
-    from app.models.job import Job
-    
-    stmt = select(Property).options(
-        selectinload(Property.rooms).selectinload(Room.images).selectinload(Image.jobs)
-    ).where(Property.id == property_id)
-    
-    result = await db.execute(stmt)
-    db_prop = result.scalar_one()
-    
-    # Manually populate latest_result_url and settings for each image in each room
-    for room in db_prop.rooms:
-        for img in room.images:
-            completed_jobs = [j for j in img.jobs if j.status == "completed" and j.result_url]
-            if completed_jobs:
-                latest_job = completed_jobs[0]
-                img.latest_result_url = latest_job.result_url
-                img.latest_settings = {
-                    "style_preset": latest_job.style_preset,
-                    "fix_white_balance": latest_job.fix_white_balance,
-                    "wall_decorations": latest_job.wall_decorations,
-                    "include_tv": latest_job.include_tv
-                }
-    
-    return db_prop
+async def get_property(property_id: uuid.UUID, request: Request, db: AsyncSession = Depends(get_db)):
+    async def build() -> str:
+        # For async we must use selectinload for nested relationships
+        from sqlalchemy.orm import selectinload
+        from app.models.image import Image
+
+        # One job row per image (its latest completed one), not the image's whole job history
+        stmt = select(Property).options(
+            selectinload(Property.rooms)
+            .selectinload(Room.images)
+            .selectinload(Image.latest_completed_job)
+            .load_only(*_latest_completed_job_columns())
+        ).where(Property.id == property_id)
+
+        result = await db.execute(stmt)
+        db_prop = result.scalar_one_or_none()
+        if not db_prop:
+            raise HTTPException(status_code=404, detail="Property not found")
+
+        # Manually populate latest_result_url and settings for each image in each room
+        for room in db_prop.rooms:
+            for img in room.images:
+                _populate_latest_result(img)
+
+        return PropertyWithRooms.model_validate(db_prop).model_dump_json()
+
+    # Unchanged since the last request: served from Redis (or 304) without touching Postgres
+    version = await get_property_version(property_id)
+    return await cached_response(request, f"property-{property_id}", version, build)
 
 @router.post("/{property_id}/rooms", response_model=RoomRead)
 async def create_room(property_id: uuid.UUID, room: RoomCreate, db: AsyncSession = Depends(get_db)):
@@ -82,6 +103,7 @@ async def create_room(property_id: uuid.UUID, room: RoomCreate, db: AsyncSession
     )
     db.add(db_room)
     await db.commit()
+    await bump_property_version(property_id)
     
     # Fetch back with selectinload to ensure images collection is initialized and safe for async serialization
     from sqlalchemy.orm import selectinload
@@ -90,33 +112,32 @@ async def create_room(property_id: uuid.UUID, room: RoomCreate, db: AsyncSession
     return result.scalar_one()
 
 @router.get("/rooms/{room_id}", response_model=RoomRead)
-async def get_room(room_id: uuid.UUID, db: AsyncSession = Depends(get_db)):
-    from sqlalchemy.orm import selectinload
-    from app.models.image import Image
-    from app.models.job import Job
-    stmt = select(Room).options(
-        selectinload(Room.images).selectinload(Image.jobs)
-    ).where(Room.id == room_id)
-    result = await db.execute(stmt)
-    db_room = result.scalar_one_or_none()
-    if not db_room:
+async def get_room(room_id: uuid.UUID, request: Request, db: AsyncSession = Depends(get_db)):
+    async def build() -> str:
+        from sqlalchemy.orm import selectinload
+        from app.models.image import Image
+        stmt = select(Room).options(
+            selectinload(Room.images)
+            .selectinload(Image.latest_completed_job)
+            .load_only(*_latest_completed_job_columns())
+        ).where(Room.id == room_id)
+        result = await db.execute(stmt)
+        db_room = result.scalar_one_or_none()
+        if not db_room:
+            raise HTTPException(status_code=404, detail="Room not found")
+
+        # Manually populate latest_result_url and settings for each image
+        for img in db_room.images:
+            _populate_latest_result(img)
+
+        return RoomRead.model_validate(db_room).model_dump_json()
+
+    # Rooms share their property's version: any change in the property invalidates the room too
+    property_id = await room_property_id(db, room_id)
+    if property_id is None:
         raise HTTPException(status_code=404, detail="Room not found")
-    
-    # Manually populate latest_result_url and settings for each image
-    for img in db_room.images:
-        completed_jobs = [j for j in img.jobs if j.status == "completed" and j.result_url]
-        if completed_jobs:
-            # Jobs are ordered by created_at desc in model relationship
-            latest_job = completed_jobs[0]
-            img.latest_result_url = latest_job.result_url
-            img.latest_settings = {
-                "style_preset": latest_job.style_preset,
-                "fix_white_balance": latest_job.fix_white_balance,
-                "wall_decorations": latest_job.wall_decorations,
-                "include_tv": latest_job.include_tv
-            }
-            
-    return db_room
+    version = await get_property_version(property_id)
+    return await cached_response(request, f"room-{room_id}", version, build)
 @router.delete("/rooms/{room_id}")
 async def delete_room(room_id: uuid.UUID, db: AsyncSession = Depends(get_db)):
     from app.models.image import Image
@@ -136,4 +157,5 @@ async def delete_room(room_id: uuid.UUID, db: AsyncSession = Depends(get_db)):
         
     await db.delete(db_room)
     await db.commit()
+    await bump_property_version(db_room.property_id)
     return {"message": "Room deleted successfully"}
@@ -4,6 +4,43 @@ class Settings(BaseSettings):
     PROJECT_NAME: str = "StageMasterAI"
     DATABASE_URL: str = "postgresql+asyncpg://postgres:postgres@db:5432/stage_db"
     REDIS_URL: str = "redis://redis:6379/0"
+
+    PROCESS_ROLE: str = "api"  # api | worker; selects the database pool profile
+
+    DB_ECHO: bool = False  # Log every SQL statement (development only)
+    DB_API_POOL_SIZE: int = 5  # Per API process (uvicorn worker)
+    DB_API_MAX_OVERFLOW: int = 10
+    DB_WORKER_POOL_SIZE: int = 6  # Per worker process; sized for WORKER_CONCURRENCY jobs plus background tasks
+    DB_WORKER_MAX_OVERFLOW: int = 2
+    DB_POOL_TIMEOUT_SECONDS: float = 30.0
+    DB_POOL_RECYCLE_SECONDS: int = 1800  # Replace connections before idle timeouts on the server/proxy
+    DB_POOL_PRE_PING: bool = True
+    DB_QUERY_CACHE_SIZE: int = 500  # SQLAlchemy compiled-statement cache
+    DB_PREPARED_STATEMENT_CACHE_SIZE: int = 100  # Per-connection prepared statements (0 behind pgbouncer in transaction mode)
+    DB_ASYNCPG_STATEMENT_CACHE_SIZE: int = 100  # asyncpg's own statement cache (0 behind pgbouncer in transaction mode)
+
+    WORKER_CONCURRENCY: int = 4  # Staging jobs run concurrently per worker process
+    WORKER_SHUTDOWN_TIMEOUT_SECONDS: int = 60  # Grace period for running jobs on SIGTERM
+    WORKER_HEARTBEAT_TTL_SECONDS: int = 30  # Jobs of a worker silent for this long are requeued
+    STAGING_JOB_TIMEOUT_SECONDS: int = 300
+    QUEUE_INTERACTIVE_WEIGHT: int = 4  # Interactive-lane turns per QUEUE_BULK_WEIGHT bulk-lane turns
+    QUEUE_BULK_WEIGHT: int = 1
+    QUEUE_WAIT_SAMPLES: int = 1000  # Recent queue wait times kept per lane for metrics
+    QUEUE_HOLD_TIMEOUT_SECONDS: int = 1800  # Dependents stop waiting for a job that has not finished by then
+    JOB_MAX_RETRIES: int = 3  # Requeues of a job throttled by a model provider before it fails
+    JOB_RETRY_BASE_DELAY_SECONDS: float = 30.0  # Doubled per retry unless the provider sent Retry-After
+    JOB_RETRY_MAX_DELAY_SECONDS: float = 600.0
+    PROGRESS_FLUSH_INTERVAL_SECONDS: float = 2.0  # Batched write of job progress to Postgres
+    PROGRESS_MAX_ATTEMPTS: int = 10  # Failed progress writes of a job before its pending fields are dropped
+
+    JOB_EVENTS_TTL_SECONDS: int = 3600  # Cached job status lifetime while a job runs
+    JOB_EVENTS_TERMINAL_TTL_SECONDS: int = 3600  # ...and after it completed or failed
+    JOB_EVENTS_KEEPALIVE_SECONDS: float = 15.0
+
+    RESPONSE_CACHE_TTL_SECONDS: int = 600  # Cached property/room responses; also bounds staleness if a version bump fails
+
+    JOBS_PAGE_SIZE: int = 50
+    JOBS_PAGE_MAX_SIZE: int = 200
     
     STORAGE_ENDPOINT: str = "minio:9000"
     STORAGE_ACCESS_KEY: str = "minioadmin"
@@ -12,18 +49,53 @@ class Settings(BaseSettings):
     STORAGE_USE_IAM: bool = False  # Use IAM instance profile for AWS
     STORAGE_REGION: str = "us-east-1"
     STORAGE_PUBLIC_ENDPOINT: str = "localhost:9000"
+    STORAGE_MAX_CONCURRENCY: int = 16  # Storage thread pool size and HTTP connection pool size
+    STORAGE_MULTIPART_PART_SIZE: int = 8 * 1024 * 1024  # Streaming upload part size (S3 minimum is 5 MiB)
     
     BUCKET_UPLOADS: str = "stage-uploads"
     BUCKET_RESULTS: str = "stage-results"
     BUCKET_THUMBNAILS: str = "stage-thumbnails"
+
+    IMAGE_PROCESSING_THREADS: int = 4  # Pool for all Pillow work: encoding, resizing, derivatives, thumbnails
+    IMAGE_CACHE_MAX_BYTES: int = 256 * 1024 * 1024  # Cross-job LRU of encoded images keyed by URL + ETag, per process (0 disables)
     
     OPENROUTER_API_KEY: str = ""
+    OPENROUTER_TIMEOUT_SECONDS: float = 60.0
+
+    # Limits shared by all workers, per provider or "provider/model" (overrides the provider):
+    # sustained requests per second, burst size and calls in flight
+    PROVIDER_LIMITS: dict[str, dict[str, float]] = {
+        "default": {"rate": 1.0, "burst": 5, "concurrency": 8},
+        "openrouter": {"rate": 1.0, "burst": 5, "concurrency": 8},
+        "vertex": {"rate": 0.5, "burst": 2, "concurrency": 4},
+    }
+    RATE_LIMIT_MAX_WAIT_SECONDS: float = 60.0  # Longer waits requeue the job instead of holding a worker slot
+    RATE_LIMIT_INCREASE_FRACTION: float = 0.05  # AIMD: rate added per successful call, as a fraction of the limit
+    RATE_LIMIT_DECREASE_FACTOR: float = 0.5  # AIMD: rate multiplier on a 429
+    RATE_LIMIT_MIN_FRACTION: float = 0.1  # Lowest rate AIMD backs off to, as a fraction of the limit
+    RATE_LIMIT_DEFAULT_PAUSE_SECONDS: float = 10.0  # Pause after a 429 without Retry-After
+
+    # Shared outbound HTTP client (OpenRouter, external image URLs)
+    HTTP_CLIENT_HTTP2: bool = True
+    HTTP_CLIENT_MAX_CONNECTIONS: int = 100
+    HTTP_CLIENT_MAX_KEEPALIVE_CONNECTIONS: int = 20
+    HTTP_CLIENT_KEEPALIVE_EXPIRY_SECONDS: float = 60.0
+    HTTP_CLIENT_TIMEOUT_SECONDS: float = 30.0
+    HTTP_CLIENT_CONNECT_TIMEOUT_SECONDS: float = 5.0
+    HTTP_CLIENT_MAX_RETRIES: int = 3  # Retries on 429/5xx and transport errors
+    HTTP_CLIENT_RETRY_BASE_DELAY_SECONDS: float = 0.5
+    HTTP_CLIENT_RETRY_MAX_DELAY_SECONDS: float = 20.0
     LITELLM_ANALYSIS_MODEL: str = "openrouter/google/gemini-2.0-flash-exp:free"
     LITELLM_GENERATION_MODEL: str = "openrouter/google/gemini-2.0-flash-exp:free"
 
+    LLM_CACHE_ENABLED: bool = True  # Reuse analysis/plan/prompt results for identical inputs
+    LLM_CACHE_TTL_SECONDS: int = 7 * 24 * 3600
+    LLM_CACHE_MAX_BYTES: int = 256 * 1024 * 1024  # Total size of cached completions in Redis (0 disables)
+
     GOOGLE_CLOUD_PROJECT: str = ""
     GOOGLE_CLOUD_LOCATION: str = "us-central1"
     VERTEX_IMAGEN_MODEL: str = "imagen-3.0-capability-001"
+    VERTEX_CLIENT_TTL_SECONDS: int = 6 * 3600  # Rebuild the cached Vertex client after this long
     GOOGLE_SERVICE_ACCOUNT_JSON: str = ""  # Full service account JSON string (alternative to GOOGLE_APPLICATION_CREDENTIALS file)
     
     DEFAULT_USER_ID: str = "d7e45013-a883-4f63-8534-e1136093ba7a"
@@ -2,7 +2,6 @@ from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from uvicorn.middleware.proxy_headers import ProxyHeadersMiddleware
 from app.api.routes import images, jobs, properties
-from app.models import Base
 from app.models.base import engine
 
 app = FastAPI(title="StageMasterAI API")
@@ -21,25 +20,12 @@ app.add_middleware(
 
 @app.on_event("startup")
 async def startup():
-    # Create tables on startup for the MVP with retry logic
+    # Schema is managed by Alembic (`alembic upgrade head` runs before the server starts).
+    # Wait for the database and make sure the default user exists.
     import asyncio
     retries = 5
     while retries > 0:
         try:
-            async with engine.begin() as conn:
-                await conn.run_sync(Base.metadata.create_all)
-                # Manual migration for room_id column in images table
-                from sqlalchemy import text
-                try:
-                    await conn.execute(text("ALTER TABLE images ADD COLUMN IF NOT EXISTS room_id UUID REFERENCES rooms(id)"))
-                    await conn.execute(text("ALTER TABLE jobs ADD COLUMN IF NOT EXISTS room_id UUID REFERENCES rooms(id)"))
-                    await conn.execute(text("ALTER TABLE jobs ADD COLUMN IF NOT EXISTS analysis TEXT"))
-                    await conn.execute(text("ALTER TABLE jobs ADD COLUMN IF NOT EXISTS placement_plan TEXT"))
-                    await conn.execute(text("ALTER TABLE jobs ADD COLUMN IF NOT EXISTS generation_prompt TEXT"))
-                    await conn.execute(text("ALTER TABLE jobs ADD COLUMN IF NOT EXISTS model VARCHAR DEFAULT 'v2'"))
-                except Exception as e:
-                    print(f"Migration error (already exists?): {e}")
-            
             # Ensure default user exists
             from sqlalchemy.ext.asyncio import AsyncSession
             from sqlalchemy.orm import sessionmaker
@@ -68,6 +54,11 @@ async def startup():
                 raise e
             await asyncio.sleep(5)
 
+@app.on_event("shutdown")
+async def shutdown():
+    from app.services.http_client import close_http_client
+    await close_http_client()
+
 app.include_router(images.router, prefix="/api/v1/images", tags=["images"])
 app.include_router(jobs.router, prefix="/api/v1/jobs", tags=["jobs"])
 app.include_router(properties.router, prefix="/api/v1/properties", tags=["properties"])
@@ -4,7 +4,30 @@ from app.core.config import settings
 
 Base = declarative_base()
 
-engine = create_async_engine(settings.DATABASE_URL, echo=True)
+
+def _pool_profile() -> dict:
+    """
+    Pool sizing per process role. API processes serve many short requests;
+    the worker holds a few connections for its concurrent jobs.
+    """
+    if settings.PROCESS_ROLE == "worker":
+        return {"pool_size": settings.DB_WORKER_POOL_SIZE, "max_overflow": settings.DB_WORKER_MAX_OVERFLOW}
+    return {"pool_size": settings.DB_API_POOL_SIZE, "max_overflow": settings.DB_API_MAX_OVERFLOW}
+
+
+engine = create_async_engine(
+    settings.DATABASE_URL,
+    echo=settings.DB_ECHO,
+    pool_timeout=settings.DB_POOL_TIMEOUT_SECONDS,
+    pool_recycle=settings.DB_POOL_RECYCLE_SECONDS,
+    pool_pre_ping=settings.DB_POOL_PRE_PING,
+    query_cache_size=settings.DB_QUERY_CACHE_SIZE,
+    connect_args={
+        "prepared_statement_cache_size": settings.DB_PREPARED_STATEMENT_CACHE_SIZE,
+        "statement_cache_size": settings.DB_ASYNCPG_STATEMENT_CACHE_SIZE,
+    },
+    **_pool_profile(),
+)
 AsyncSessionLocal = sessionmaker(
     engine, class_=AsyncSession, expire_on_commit=False
 )
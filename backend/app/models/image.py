@@ -1,12 +1,15 @@
 import uuid
 from datetime import datetime
-from sqlalchemy import Column, String, Integer, DateTime, ForeignKey
+from sqlalchemy import Column, String, Integer, DateTime, ForeignKey, JSON, Index
 from sqlalchemy.dialects.postgresql import UUID
 from sqlalchemy.orm import relationship
 from app.models.base import Base
 
 class Image(Base):
     __tablename__ = "images"
+    __table_args__ = (
+        Index("ix_images_room_id_created_at", "room_id", "created_at"),
+    )
 
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
     user_id = Column(UUID(as_uuid=True), ForeignKey("users.id"), nullable=False)
@@ -18,7 +21,19 @@ class Image(Base):
     height = Column(Integer)
     file_size = Column(Integer)
     format = Column(String)
+    orientation = Column(Integer, nullable=True)  # EXIF orientation tag (1 = upright)
+    content_hash = Column(String, nullable=True)  # SHA-256 of the uploaded bytes
+    phash = Column(String, nullable=True)  # Perceptual (difference) hash, 16 hex chars
+    model_input_url = Column(String, nullable=True)  # Pre-sized (<= 2160px) rendition sent to the models
+    thumbnails = Column(JSON, nullable=True)  # Gallery thumbnail URLs keyed by size name
+    # Newest completed job, kept up to date by the worker (see refresh_latest_completed_job)
+    latest_completed_job_id = Column(
+        UUID(as_uuid=True),
+        ForeignKey("jobs.id", ondelete="SET NULL", use_alter=True, name="images_latest_completed_job_id_fkey"),
+        nullable=True,
+    )
     created_at = Column(DateTime, default=datetime.utcnow)
 
     room = relationship("Room", back_populates="images", foreign_keys=[room_id])
-    jobs = relationship("Job", back_populates="image", order_by="desc(Job.created_at)")
+    jobs = relationship("Job", back_populates="image", foreign_keys="Job.image_id", order_by="desc(Job.created_at)")
+    latest_completed_job = relationship("Job", foreign_keys=[latest_completed_job_id], viewonly=True)
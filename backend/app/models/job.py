@@ -1,21 +1,32 @@
 import uuid
 from datetime import datetime
-from sqlalchemy import Column, String, Integer, DateTime, ForeignKey, Float, Boolean
+from sqlalchemy import Column, String, Integer, DateTime, ForeignKey, Float, Boolean, JSON, Index
 from sqlalchemy.dialects.postgresql import UUID
 from sqlalchemy.orm import relationship
 from app.models.base import Base
 
 class Job(Base):
     __tablename__ = "jobs"
+    # Created by alembic revision 0002; see there for the queries each one serves
+    __table_args__ = (
+        Index("ix_jobs_image_id_status_created_at", "image_id", "status", "created_at"),
+        Index("ix_jobs_created_at_id", "created_at", "id"),
+        Index("ix_jobs_user_id_created_at_id", "user_id", "created_at", "id"),
+        Index("ix_jobs_room_id_created_at_id", "room_id", "created_at", "id"),
+        Index("ix_jobs_status_created_at_id", "status", "created_at", "id"),
+        Index("ix_jobs_depends_on_job_id", "depends_on_job_id"),
+    )
 
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
     user_id = Column(UUID(as_uuid=True), ForeignKey("users.id"), nullable=False)
     image_id = Column(UUID(as_uuid=True), ForeignKey("images.id"), nullable=False)
     room_id = Column(UUID(as_uuid=True), ForeignKey("rooms.id"), nullable=True)
+    # Job that must finish first, e.g. the room's reference image job for the other angles
+    depends_on_job_id = Column(UUID(as_uuid=True), ForeignKey("jobs.id", ondelete="SET NULL"), nullable=True)
     room_type = Column(String, nullable=False)
     style_preset = Column(String, nullable=False)
 
-    image = relationship("Image", back_populates="jobs")
+    image = relationship("Image", back_populates="jobs", foreign_keys=[image_id])
     style_preset = Column(String, nullable=False)
     model = Column(String, default="v2")  # v1 = openrouter, v2 = vertexai
     fix_white_balance = Column(Boolean, default=False)
@@ -31,6 +42,7 @@ class Job(Base):
     started_at = Column(DateTime, nullable=True)
     completed_at = Column(DateTime, nullable=True)
     result_url = Column(String, nullable=True)
+    thumbnails = Column(JSON, nullable=True)  # Result thumbnail URLs keyed by size name
     
     # Store LLM results for consistency
     analysis = Column(String, nullable=True)
@@ -9,10 +9,10 @@ class Room(Base):
     __tablename__ = "rooms"
 
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
-    property_id = Column(UUID(as_uuid=True), ForeignKey("properties.id"), nullable=False)
+    property_id = Column(UUID(as_uuid=True), ForeignKey("properties.id"), nullable=False, index=True)
     name = Column(String, nullable=False)
     room_type = Column(String, nullable=False)
-    reference_image_id = Column(UUID(as_uuid=True), ForeignKey("images.id"), nullable=True)
+    reference_image_id = Column(UUID(as_uuid=True), ForeignKey("images.id"), nullable=True, index=True)
     created_at = Column(DateTime, default=datetime.utcnow)
 
     property = relationship("Property", back_populates="rooms")
@@ -14,11 +14,17 @@ class ImageCreate(ImageBase):
     height: Optional[int] = None
     file_size: Optional[int] = None
     format: Optional[str] = None
+    orientation: Optional[int] = None
+    content_hash: Optional[str] = None
 
 class ImageRead(ImageBase):
     model_config = ConfigDict(from_attributes=True)
     id: UUID
     original_url: str
+    width: Optional[int] = None
+    height: Optional[int] = None
+    thumbnails: Optional[dict] = None
     latest_result_url: Optional[str] = None
+    latest_result_thumbnails: Optional[dict] = None
     latest_settings: Optional[dict] = None
     created_at: datetime
@@ -1,7 +1,7 @@
 from pydantic import BaseModel, ConfigDict
 from uuid import UUID
 from datetime import datetime
-from typing import Optional, List
+from typing import Dict, Optional, List
 
 class JobBase(BaseModel):
     model_config = ConfigDict(from_attributes=True)
@@ -21,13 +21,46 @@ class JobRead(JobBase):
     user_id: UUID
     image_id: UUID
     status: str
+    depends_on_job_id: Optional[UUID] = None
+    retry_count: Optional[int] = 0  # Times the job was requeued after a model provider throttled it
     progress_percent: float
     current_step: Optional[str] = None
     result_url: Optional[str] = None
+    thumbnails: Optional[dict] = None
     original_image_url: Optional[str] = None
+    original_image_thumbnails: Optional[dict] = None
     created_at: datetime
     started_at: Optional[datetime] = None
     completed_at: Optional[datetime] = None
 
+class JobBatchCreate(BaseModel):
+    """Stages every image of a room or of a whole property with the same settings."""
+    room_id: Optional[UUID] = None
+    property_id: Optional[UUID] = None
+    image_ids: Optional[List[UUID]] = None  # Subset of the room/property images; all of them when omitted
+    style_preset: str
+    model: str = "v2"
+    fix_white_balance: bool = False
+    wall_decorations: bool = True
+    include_tv: bool = False
+
+class JobBatchRead(BaseModel):
+    jobs: List[JobRead]
+
 class JobList(BaseModel):
     jobs: List[JobRead]
+    next_cursor: Optional[str] = None  # Pass as ?cursor= to fetch the next page; None on the last page
+
+class LaneMetrics(BaseModel):
+    depth: int  # Jobs waiting in the lane
+    users: int  # Users with jobs waiting
+    wait_seconds_p50: Optional[float] = None  # Over the lane's recent dequeues
+    wait_seconds_p95: Optional[float] = None
+    wait_seconds_max: Optional[float] = None
+    wait_samples: int
+
+class QueueMetrics(BaseModel):
+    lanes: Dict[str, LaneMetrics]
+    retrying: int  # Jobs waiting to be retried after a provider throttled them
+    workers: int
+    in_progress: int
@@ -1,5 +1,6 @@
 import asyncio
 import logging
+import time
 from datetime import datetime
 from sqlalchemy import update
 from app.models.base import AsyncSessionLocal
@@ -13,161 +14,396 @@ from sqlalchemy import select
 from app.models.image import Image
 from app.services.llm_service import analyze_room, plan_furniture_placement, generate_staged_image_prompt
 from app.services.image_service import generate_image
+from app.services.image_cache import ImageContext
+from app.services.image_processing import create_result_thumbnails
 from app.services.storage import storage_service
+from app.services.pipeline import StageGraph
+from app.services.image_results import refresh_latest_completed_job
+from app.services.response_cache import bump_room_version
+from app.services.job_events import publish_job_event
+from app.services.job_outputs import get_job_outputs, publish_job_outputs
+from app.services.job_queue import retry_later
+from app.services.rate_limiter import is_rate_limited, retry_after_seconds
+from app.services.progress import progress_writer
+from app.services.model_clients import warm_up_model_clients
 
-async def _process_staging_job_async(job_id: str):
+class ReferenceContext:
+    """What a non-reference angle inherits from its room's reference image."""
+
+    def __init__(self, image_url: str | None = None, analysis: str | None = None, plan: str | None = None):
+        self.image_url = image_url
+        self.analysis = analysis
+        self.plan = plan
+
+
+async def _find_reference(session, db_job: Job, db_image: Image, image_context: ImageContext) -> ReferenceContext:
     """
-    Internal async implementation of the staging job.
+    Resolves the room's reference image and its latest completed job in a single
+    joined query (room -> reference image -> latest completed job).
     """
-    async with AsyncSessionLocal() as session:
-        # Fetch job and associated image
-        stmt = select(Job, Image).join(Image, Job.image_id == Image.id).where(Job.id == job_id)
-        result = await session.execute(stmt)
-        record = result.one_or_none()
+    if not db_job.room_id:
+        return ReferenceContext()
+
+    from app.models.room import Room
+
+    stmt = (
+        select(Room, Image, Job)
+        .join(Image, Image.id == Room.reference_image_id)
+        .outerjoin(Job, Job.id == Image.latest_completed_job_id)
+        .where(Room.id == db_job.room_id)
+    )
+    record = (await session.execute(stmt)).one_or_none()
+    if not record:
+        return ReferenceContext()
+
+    db_room, db_ref_image, db_ref_job = record
+    if db_room.reference_image_id == db_image.id:
+        return ReferenceContext()
+
+    image_context.register_image(db_ref_image)
+    reference = ReferenceContext(image_url=db_ref_image.original_url)
+
+    # Find the latest successful job for the reference image to inherit the plan
+    if db_ref_job:
+        reference.analysis = db_ref_job.analysis
+        reference.plan = db_ref_job.placement_plan
+        # PRIORITIZE STAGED IMAGE FOR CONSISTENCY
+        if db_ref_job.result_url:
+            reference.image_url = db_ref_job.result_url
+            logger.info(f"Using STAGED reference image for consistency: {reference.image_url}")
+        else:
+            logger.info(f"Using ORIGINAL reference image for consistency (no staged version found): {reference.image_url}")
         
-        if not record:
-            logger.error(f"Job {job_id} or associated image not found")
-            return
+        logger.info(f"Inheriting furniture plan from reference job: {db_ref_job.id}")
+
+    return reference
+
+
+async def _inherited_reference(db_job: Job) -> ReferenceContext | None:
+    """
+    The outputs of the reference job this job waited for, read from Redis
+    without a database lookup. None unless that job produced a staged result.
+    """
+    if not db_job.depends_on_job_id:
+        return None
+    outputs = await get_job_outputs(str(db_job.depends_on_job_id))
+    if not outputs.get("result_url"):
+        return None
+    logger.info(f"Inheriting furniture plan from reference job: {db_job.depends_on_job_id}")
+    return ReferenceContext(
+        image_url=outputs["result_url"],
+        analysis=outputs.get("analysis"),
+        plan=outputs.get("placement_plan"),
+    )
+
+
+# Allowed source states of every job state transition
+JOB_TRANSITIONS = {
+    "in_progress": ("queued",),
+    "completed": ("in_progress",),
+    "error": ("queued", "in_progress"),
+    "queued": ("in_progress",),  # back to the queue for a retry, or when its worker died or shut down
+}
+
 
-        db_job, db_image = record
+async def _claim_job(job_id: str) -> tuple[Job, Image] | None:
+    """
+    Moves a job to in_progress with a single UPDATE ... RETURNING and loads its
+    image, in one short transaction. Returns None if the job does not exist or
+    is not queued (e.g. a duplicate queue entry of a job that is running or
+    finished). The returned instances are detached; the pipeline only reads them.
+    """
+    fields = {
+        "status": "in_progress",
+        "started_at": datetime.utcnow(),
+        "progress_percent": 10.0,
+        "current_step": "Analyzing room layout...",
+    }
+    async with AsyncSessionLocal() as session:
+        stmt = (
+            update(Job)
+            .where(Job.id == job_id, Job.status.in_(JOB_TRANSITIONS["in_progress"]))
+            .values(**fields)
+            .returning(Job)
+        )
+        db_job = (await session.execute(stmt)).scalar_one_or_none()
+        if db_job is None:
+            return None
+        db_image = await session.get(Image, db_job.image_id)
+        await session.commit()
+
+    await publish_job_event(job_id, **fields)
+    return db_job, db_image
 
-        # Update status to in_progress
-        db_job.status = "in_progress"
-        db_job.started_at = datetime.utcnow()
-        db_job.progress_percent = 10.0
-        db_job.current_step = "Analyzing room layout..."
+
+async def _transition_job(job_id: str, status: str, image_id=None, **fields) -> bool:
+    """
+    Moves a job to `status` in its own short transaction, only from one of the
+    allowed source states, writing any progress still buffered for it. A
+    completed job also becomes its image's latest result in the same
+    transaction. Returns whether the transition was applied.
+    """
+    fields = {**await progress_writer.take(job_id), **fields, "status": status}
+    async with AsyncSessionLocal() as session:
+        stmt = (
+            update(Job)
+            .where(Job.id == job_id, Job.status.in_(JOB_TRANSITIONS[status]))
+            .values(**fields)
+            .execution_options(synchronize_session=False)
+        )
+        result = await session.execute(stmt)
+        if result.rowcount == 0:
+            return False
+        if status == "completed" and image_id is not None:
+            await refresh_latest_completed_job(session, image_id)
         await session.commit()
 
-        try:
-            # 0. Check for reference image if in a room
-            reference_image_url = None
-            ref_analysis = None
-            ref_plan = None
-            
-            if db_job.room_id:
-                from app.models.room import Room
-                room_stmt = select(Room).where(Room.id == db_job.room_id)
-                room_result = await session.execute(room_stmt)
-                db_room = room_result.scalar_one_or_none()
-                
-                if db_room and db_room.reference_image_id and db_room.reference_image_id != db_image.id:
-                    # Get the reference image
-                    ref_img_stmt = select(Image).where(Image.id == db_room.reference_image_id)
-                    ref_img_result = await session.execute(ref_img_stmt)
-                    db_ref_image = ref_img_result.scalar_one_or_none()
-                    
-                    if db_ref_image:
-                        reference_image_url = db_ref_image.original_url
-                        
-                        # Find the latest successful job for the reference image to inherit the plan
-                        ref_job_stmt = select(Job).where(
-                            Job.image_id == db_room.reference_image_id,
-                            Job.status == "completed"
-                        ).order_by(Job.created_at.desc()).limit(1)
-                        ref_job_result = await session.execute(ref_job_stmt)
-                        db_ref_job = ref_job_result.scalar_one_or_none()
-                        
-                        if db_ref_job:
-                            ref_analysis = db_ref_job.analysis
-                            ref_plan = db_ref_job.placement_plan
-                            # PRIORITIZE STAGED IMAGE FOR CONSISTENCY
-                            if db_ref_job.result_url:
-                                reference_image_url = db_ref_job.result_url
-                                logger.info(f"Using STAGED reference image for consistency: {reference_image_url}")
-                            else:
-                                reference_image_url = db_ref_image.original_url
-                                logger.info(f"Using ORIGINAL reference image for consistency (no staged version found): {reference_image_url}")
-                            
-                            logger.info(f"Inheriting furniture plan from reference job: {db_ref_job.id}")
-
-            # 1. Analyze Room
-            logger.info(f"Analyzing room for job {job_id}")
-            analysis = await analyze_room(
-                db_image.original_url, 
-                reference_image_url=reference_image_url,
-                reference_analysis=ref_analysis
-            )
-            db_job.analysis = analysis
-            
-            db_job.progress_percent = 30.0
-            db_job.current_step = "Detecting surfaces and depth..."
-            await session.commit()
-
-            # 2. Plan Furniture Placement
-            logger.info(f"Planning furniture placement for job {job_id}")
-            placement_plan = await plan_furniture_placement(
-                analysis,
-                db_job.room_type,
-                db_job.style_preset,
-                wall_decorations=db_job.wall_decorations,
-                include_tv=db_job.include_tv,
-                target_image_url=db_image.original_url,
-                reference_image_url=reference_image_url,
-                reference_plan=ref_plan
-            )
-            db_job.placement_plan = placement_plan
-            
-            db_job.progress_percent = 60.0
-            db_job.current_step = "Generating furniture placement plan..."
-            await session.commit()
-            
-            # 3. Generate Staged Image Prompt
-            logger.info(f"Generating staged image prompt for job {job_id}")
-            generation_prompt = await generate_staged_image_prompt(
-                db_image.original_url,
-                analysis,
-                placement_plan,
-                db_job.style_preset,
-                fix_white_balance=db_job.fix_white_balance,
-                wall_decorations=db_job.wall_decorations,
-                include_tv=db_job.include_tv,
-                reference_image_url=reference_image_url,
-                reference_plan=ref_plan # Prompt generation also benefits from the source plan
-            )
-            db_job.generation_prompt = generation_prompt
-            
-            db_job.progress_percent = 80.0
-            db_job.current_step = "Rendering final image..."
-            await session.commit()
-            
-            # Real Image Generation
-            logger.info(f"Generating image for job {job_id}")
-            image_data = await generate_image(
-                generation_prompt,
-                db_image.original_url,
-                fix_white_balance=db_job.fix_white_balance,
-                reference_image_url=reference_image_url,
-                model=db_job.model or "v2"
-            )
-            # image_data is now bytes (decoded from base64 or downloaded)
-                
-            # Upload to results bucket
-            result_url = await storage_service.upload_file(
+    await publish_job_event(job_id, **fields)
+    return True
+
+
+async def reset_interrupted_job(job_id: str) -> bool:
+    """
+    Moves a job whose worker died or shut down mid-run back to queued, before
+    it is requeued, so the next worker can claim it. Returns whether it was
+    still in progress.
+    """
+    return await _transition_job(
+        job_id, "queued", progress_percent=0.0, current_step="Worker restarted, waiting to resume..."
+    )
+
+
+async def _schedule_retry(db_job: Job, error: Exception) -> bool:
+    """
+    Requeues a job a model provider throttled, after the provider's
+    Retry-After or an exponential backoff, counting it in retry_count.
+    Returns False once the job is out of retries.
+    """
+    job_id = str(db_job.id)
+    retries = db_job.retry_count or 0
+    if retries >= settings.JOB_MAX_RETRIES:
+        return False
+    delay = retry_after_seconds(error) or settings.JOB_RETRY_BASE_DELAY_SECONDS * 2 ** retries
+    delay = min(delay, settings.JOB_RETRY_MAX_DELAY_SECONDS)
+
+    # Scheduled first: a retry entry for a job that is no longer running is ignored when claimed
+    await retry_later(job_id, delay)
+    requeued = await _transition_job(
+        job_id,
+        "queued",
+        retry_count=retries + 1,
+        progress_percent=0.0,
+        current_step=f"Model provider busy, retrying in {delay:.0f}s ({retries + 1}/{settings.JOB_MAX_RETRIES})...",
+    )
+    if requeued:
+        logger.warning(f"Job {job_id} throttled ({error}); retry {retries + 1} in {delay:.0f}s")
+    return requeued
+
+
+# LLM stages whose output is saved on the job, in pipeline order
+CHECKPOINTED_STAGES = (("analyze", "analysis"), ("plan", "placement_plan"), ("prompt", "generation_prompt"))
+
+# Progress reported when a stage finishes (or is resumed from its checkpoint)
+STAGE_PROGRESS = {
+    "analyze": {"progress_percent": 30.0, "current_step": "Detecting surfaces and depth..."},
+    "plan": {"progress_percent": 60.0, "current_step": "Generating furniture placement plan..."},
+    "prompt": {"progress_percent": 80.0, "current_step": "Rendering final image..."},
+}
+
+
+def _checkpoints(db_job: Job) -> dict[str, str]:
+    """
+    Saved outputs of an earlier attempt, up to the first stage without one:
+    a retried job resumes there instead of repeating the LLM calls.
+    """
+    checkpoints = {}
+    for stage, column in CHECKPOINTED_STAGES:
+        output = getattr(db_job, column)
+        if not output:
+            break
+        checkpoints[stage] = output
+    return checkpoints
+
+
+async def _process_staging_job_async(job_id: str) -> bool:
+    """
+    Runs a staging job as a series of short transactions: claim the job, look
+    up the room reference, then the external calls with no database
+    connection held (progress is buffered by the progress writer), then one
+    final transition. A worker needs a connection only for milliseconds per
+    job, so in-flight jobs are not bounded by the pool size. Stages whose
+    output an earlier attempt saved are skipped. Returns False if the job
+    could not be claimed or was taken over by another worker meanwhile: this
+    run must then not release its dependents.
+    """
+    claimed = await _claim_job(job_id)
+    if not claimed:
+        logger.error(f"Job {job_id} not found, already running or already finished")
+        return False
+
+    db_job, db_image = claimed
+
+    async def report(**fields):
+        # Clients see progress at once via Redis; the database gets it in the writer's next batched UPDATE
+        await publish_job_event(job_id, **fields)
+        await publish_job_outputs(job_id, **fields)
+        progress_writer.update(job_id, **fields)
+
+    # Shared by every stage so each photo is fetched and encoded once per job
+    image_context = ImageContext()
+    image_context.register_image(db_image)
+    started = time.perf_counter()
+
+    async def prefetch_target():
+        # Download/encode the target photo while the reference lookup runs
+        await image_context.get(db_image.original_url)
+
+    async def warm_up_renderer():
+        # First job on a worker builds the image model client while the LLM stages run
+        await warm_up_model_clients(db_job.model or "v2")
+
+    async def reference():
+        inherited = await _inherited_reference(db_job)
+        if inherited:
+            return inherited
+        async with AsyncSessionLocal() as session:
+            return await _find_reference(session, db_job, db_image, image_context)
+
+    async def prefetch_reference(reference):
+        if reference.image_url:
+            await image_context.get(reference.image_url)
+
+    async def analyze(reference):
+        logger.info(f"Analyzing room for job {job_id}")
+        analysis = await analyze_room(
+            db_image.original_url, 
+            reference_image_url=reference.image_url,
+            reference_analysis=reference.analysis,
+            image_context=image_context
+        )
+        await report(analysis=analysis, **STAGE_PROGRESS["analyze"])
+        return analysis
+
+    async def plan(reference, analyze):
+        logger.info(f"Planning furniture placement for job {job_id}")
+        placement_plan = await plan_furniture_placement(
+            analyze,
+            db_job.room_type,
+            db_job.style_preset,
+            wall_decorations=db_job.wall_decorations,
+            include_tv=db_job.include_tv,
+            target_image_url=db_image.original_url,
+            reference_image_url=reference.image_url,
+            reference_plan=reference.plan,
+            image_context=image_context
+        )
+        await report(
+            placement_plan=placement_plan,
+            **STAGE_PROGRESS["plan"],
+        )
+        return placement_plan
+
+    async def prompt(reference, analyze, plan):
+        logger.info(f"Generating staged image prompt for job {job_id}")
+        generation_prompt = await generate_staged_image_prompt(
+            db_image.original_url,
+            analyze,
+            plan,
+            db_job.style_preset,
+            fix_white_balance=db_job.fix_white_balance,
+            wall_decorations=db_job.wall_decorations,
+            include_tv=db_job.include_tv,
+            reference_image_url=reference.image_url,
+            reference_plan=reference.plan, # Prompt generation also benefits from the source plan
+            image_context=image_context
+        )
+        await report(
+            generation_prompt=generation_prompt,
+            **STAGE_PROGRESS["prompt"],
+        )
+        return generation_prompt
+
+    async def render(reference, prompt, warm_up_renderer):
+        logger.info(f"Generating image for job {job_id}")
+        # image_data is bytes (decoded from base64 or downloaded)
+        return await generate_image(
+            prompt,
+            db_image.original_url,
+            fix_white_balance=db_job.fix_white_balance,
+            reference_image_url=reference.image_url,
+            model=db_job.model or "v2",
+            image_context=image_context
+        )
+
+    async def store(render):
+        # Upload to results bucket and render gallery thumbnails concurrently
+        return await asyncio.gather(
+            storage_service.upload_file(
                 settings.BUCKET_RESULTS,
                 f"{job_id}.jpg",
-                image_data,
+                render,
                 "image/jpeg"
-            )
-            
-            db_job.status = "completed"
-            db_job.progress_percent = 100.0
-            db_job.current_step = "Final rendering complete"
-            db_job.completed_at = datetime.utcnow()
-            db_job.result_url = result_url
-            await session.commit()
-            
-            logger.info(f"Job {job_id} completed successfully")
-            
-        except Exception as e:
-            logger.error(f"Error processing job {job_id}: {str(e)}")
-            db_job.status = "error"
-            db_job.error_message = str(e)
-            await session.commit()
-
-def process_staging_job(job_id: str):
-    """
-    Sync wrapper for RQ worker to run the async job processing.
-    """
-    # Force import all models to ensure SQLAlchemy relationships are registered
-    import app.models
-    asyncio.run(_process_staging_job_async(job_id))
+            ),
+            create_result_thumbnails(job_id, render),
+        )
+
+    checkpoints = _checkpoints(db_job)
+    if checkpoints:
+        logger.info(f"Resuming job {job_id} after stage(s): {', '.join(checkpoints)}")
+        # Skipped stages never report; show where the job actually picks up
+        await report(**STAGE_PROGRESS[list(checkpoints)[-1]])
+        # Dependents read the reference's outputs from Redis, including reused ones
+        await publish_job_outputs(
+            job_id, **{column: getattr(db_job, column) for stage, column in CHECKPOINTED_STAGES if stage in checkpoints}
+        )
+
+    graph = StageGraph(f"job {job_id}")
+    graph.add("prefetch_target", prefetch_target)
+    graph.add("warm_up_renderer", warm_up_renderer)
+    graph.add("reference", reference)
+    graph.add("prefetch_reference", prefetch_reference, depends_on=("reference",))
+    graph.add("analyze", analyze, depends_on=("reference",), checkpoint=checkpoints.get("analyze"))
+    graph.add("plan", plan, depends_on=("reference", "analyze"), checkpoint=checkpoints.get("plan"))
+    graph.add("prompt", prompt, depends_on=("reference", "analyze", "plan"), checkpoint=checkpoints.get("prompt"))
+    graph.add("render", render, depends_on=("reference", "prompt", "warm_up_renderer"))
+    graph.add("store", store, depends_on=("render",))
+
+    try:
+        results = await graph.run()
+    except Exception as e:
+        logger.error(f"Error processing job {job_id}: {str(e)}")
+        if is_rate_limited(e) and await _schedule_retry(db_job, e):
+            return True
+        return await _transition_job(job_id, "error", error_message=str(e))
+
+    result_url, thumbnails = results["store"]
+    completed = await _transition_job(
+        job_id,
+        "completed",
+        image_id=db_image.id,
+        generation_time_seconds=int(time.perf_counter() - started),
+        completed_at=datetime.utcnow(),
+        progress_percent=100.0,
+        current_step="Final rendering complete",
+        result_url=result_url,
+        thumbnails=thumbnails,
+    )
+    if not completed:
+        logger.warning(f"Job {job_id} was no longer in progress; result {result_url} not recorded")
+        return False
+
+    # Before the worker releases this job's dependents
+    await publish_job_outputs(job_id, result_url=result_url)
+
+    async with AsyncSessionLocal() as session:
+        await bump_room_version(session, db_image.room_id)
+    logger.info(f"Job {job_id} completed successfully")
+    return True
+
+
+async def mark_job_failed(job_id: str, message: str) -> bool:
+    """
+    Records a failure the pipeline itself could not record (timeouts, crashes
+    outside the stages). Returns False if the job is no longer queued or running.
+    """
+    return await _transition_job(job_id, "error", error_message=message)
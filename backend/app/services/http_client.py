@@ -0,0 +1,91 @@
+import asyncio
+import logging
+import random
+import weakref
+
+import httpx
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+
+# One pooled client per event loop, like the Redis client: httpx connections are
+# bound to the loop that opened them.
+_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, httpx.AsyncClient]" = weakref.WeakKeyDictionary()
+
+
+def get_http_client() -> httpx.AsyncClient:
+    """
+    Returns the shared outbound HTTP client for the running event loop.
+    Connections are kept alive per host and multiplexed over HTTP/2 where the
+    server supports it, so repeated calls skip the TCP/TLS handshake.
+    """
+    loop = asyncio.get_running_loop()
+    client = _clients.get(loop)
+    if client is None:
+        client = httpx.AsyncClient(
+            http2=settings.HTTP_CLIENT_HTTP2,
+            limits=httpx.Limits(
+                max_connections=settings.HTTP_CLIENT_MAX_CONNECTIONS,
+                max_keepalive_connections=settings.HTTP_CLIENT_MAX_KEEPALIVE_CONNECTIONS,
+                keepalive_expiry=settings.HTTP_CLIENT_KEEPALIVE_EXPIRY_SECONDS,
+            ),
+            timeout=httpx.Timeout(
+                settings.HTTP_CLIENT_TIMEOUT_SECONDS,
+                connect=settings.HTTP_CLIENT_CONNECT_TIMEOUT_SECONDS,
+            ),
+            follow_redirects=True,
+        )
+        _clients[loop] = client
+    return client
+
+
+async def close_http_client():
+    """Closes the client of the running event loop, if one was opened."""
+    client = _clients.pop(asyncio.get_running_loop(), None)
+    if client is not None:
+        await client.aclose()
+
+
+def _retry_delay(attempt: int, response: httpx.Response | None) -> float:
+    if response is not None:
+        retry_after = response.headers.get("retry-after")
+        if retry_after and retry_after.isdigit():
+            return min(float(retry_after), settings.HTTP_CLIENT_RETRY_MAX_DELAY_SECONDS)
+    delay = settings.HTTP_CLIENT_RETRY_BASE_DELAY_SECONDS * (2 ** attempt)
+    # Full jitter so concurrent jobs hitting the same rate limit do not retry in lockstep
+    return random.uniform(0, min(delay, settings.HTTP_CLIENT_RETRY_MAX_DELAY_SECONDS))
+
+
+async def request_with_retry(
+    method: str,
+    url: str,
+    retry_status_codes: set[int] = RETRY_STATUS_CODES,
+    **kwargs,
+) -> httpx.Response:
+    """
+    Sends a request through the shared client, retrying with exponential backoff
+    on 429/5xx responses (`retry_status_codes`) and transport errors. Honours
+    Retry-After when given. Raises httpx.HTTPStatusError for the final non-2xx
+    response.
+    """
+    client = get_http_client()
+    retries = settings.HTTP_CLIENT_MAX_RETRIES
+    for attempt in range(retries + 1):
+        response = None
+        try:
+            response = await client.request(method, url, **kwargs)
+            if response.status_code not in retry_status_codes or attempt == retries:
+                response.raise_for_status()
+                return response
+            reason = f"HTTP {response.status_code}"
+        except httpx.TransportError as e:
+            if attempt == retries:
+                raise
+            reason = f"{type(e).__name__}: {e}"
+
+        delay = _retry_delay(attempt, response)
+        logger.warning(f"{method} {url} failed ({reason}), retrying in {delay:.1f}s ({attempt + 1}/{retries})")
+        await asyncio.sleep(delay)
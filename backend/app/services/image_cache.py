@@ -0,0 +1,174 @@
+import asyncio
+import base64
+import hashlib
+import logging
+from collections import OrderedDict
+from dataclasses import dataclass
+
+from app.core.config import settings
+from app.services.image_service import (
+    _encode_image,
+    _fetch_image_bytes,
+    _fetch_image_etag,
+    fit_within,
+    run_in_image_pool,
+)
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class EncodedImage:
+    """
+    An image fetched and prepared for the LLM/image-generation stages. Only the
+    base64 payload is kept (the raw bytes are dropped once encoded); decode it
+    if bytes are needed.
+    """
+    url: str
+    etag: str | None
+    width: int
+    height: int
+    media_type: str
+    base64: str
+    content_hash: str
+
+
+@dataclass(frozen=True)
+class ImageHint:
+    """Metadata already stored on the Image row, used to skip re-probing the file."""
+    width: int
+    height: int
+    media_type: str | None
+    source_url: str | None = None  # Pre-sized model-input rendition to fetch instead of the original
+    content_hash: str | None = None  # SHA-256 of the uploaded original
+
+
+class SharedImageCache:
+    """
+    Process-wide LRU of encoded images keyed by (url, etag), bounded by the
+    total size of the cached payloads rather than their count, since one
+    original can be a hundred times larger than a model-input rendition.
+    Only used when the ETag of the source object can be read, so a re-uploaded
+    object with the same URL is never served stale.
+    """
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._entries: OrderedDict[tuple[str, str], EncodedImage] = OrderedDict()
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_bytes > 0
+
+    def get(self, url: str, etag: str) -> EncodedImage | None:
+        key = (url, etag)
+        image = self._entries.get(key)
+        if image is not None:
+            self._entries.move_to_end(key)
+        return image
+
+    def put(self, image: EncodedImage):
+        if not self.enabled or not image.etag or len(image.base64) > self.max_bytes:
+            return
+        key = (image.url, image.etag)
+        previous = self._entries.pop(key, None)
+        if previous is not None:
+            self.size -= len(previous.base64)
+        self._entries[key] = image
+        self.size += len(image.base64)
+        while self.size > self.max_bytes:
+            _, evicted = self._entries.popitem(last=False)
+            self.size -= len(evicted.base64)
+
+
+shared_image_cache = SharedImageCache(settings.IMAGE_CACHE_MAX_BYTES)
+
+
+class ImageContext:
+    """
+    Job-scoped image cache. Every stage of a staging job asks the context for
+    its images, so each URL is fetched, resized and base64-encoded once per job
+    no matter how many stages use it. Concurrent requests for the same URL
+    share a single in-flight fetch.
+    """
+
+    def __init__(self, shared_cache: SharedImageCache | None = shared_image_cache):
+        self.shared_cache = shared_cache
+        self._images: dict[str, asyncio.Task] = {}
+        self._hints: dict[str, ImageHint] = {}
+
+    def register_image(self, db_image):
+        """
+        Records the stored metadata of an uploaded image under its original URL.
+        If a model-input rendition exists, stages asking for the original get the
+        rendition instead, already sized, without any resampling.
+        """
+        if not db_image.width or not db_image.height:
+            return
+        if db_image.model_input_url:
+            width, height = fit_within(db_image.width, db_image.height)
+            self._hints[db_image.original_url] = ImageHint(
+                width, height, "image/jpeg", db_image.model_input_url, db_image.content_hash
+            )
+        else:
+            self._hints[db_image.original_url] = ImageHint(
+                db_image.width, db_image.height, db_image.format, None, db_image.content_hash
+            )
+
+    async def content_hash(self, url: str) -> str:
+        """
+        Content hash identifying the image behind a URL. Uses the hash stored at
+        upload when known, so cache lookups do not need to download the image.
+        """
+        hint = self._hints.get(url)
+        if hint and hint.content_hash:
+            return hint.content_hash
+        return (await self.get(url)).content_hash
+
+    async def get(self, url: str) -> EncodedImage:
+        task = self._images.get(url)
+        if task is None:
+            task = asyncio.ensure_future(self._load(url))
+            self._images[url] = task
+        try:
+            return await asyncio.shield(task)
+        except Exception:
+            # Let a later stage retry instead of caching the failure
+            if self._images.get(url) is task:
+                del self._images[url]
+            raise
+
+    async def _load(self, url: str) -> EncodedImage:
+        hint = self._hints.get(url)
+        source_url = hint.source_url if hint and hint.source_url else url
+
+        etag = None
+        use_shared = self.shared_cache is not None and self.shared_cache.enabled
+        if use_shared:
+            etag = await _fetch_image_etag(source_url)
+            if etag:
+                cached = self.shared_cache.get(source_url, etag)
+                if cached is not None:
+                    logger.info(f"Shared image cache hit for {source_url}")
+                    return cached
+
+        content = await _fetch_image_bytes(source_url)
+        known_size = (hint.width, hint.height) if hint else None
+        known_media_type = hint.media_type if hint else None
+        encoded_content, media_type, width, height = await run_in_image_pool(
+            _encode_image, content, known_size, known_media_type
+        )
+        image = EncodedImage(
+            url=source_url,
+            etag=etag,
+            width=width,
+            height=height,
+            media_type=media_type,
+            base64=base64.b64encode(encoded_content).decode("utf-8"),
+            content_hash=hashlib.sha256(content).hexdigest(),
+        )
+
+        if use_shared:
+            self.shared_cache.put(image)
+        return image
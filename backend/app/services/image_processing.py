@@ -0,0 +1,166 @@
+import asyncio
+import io
+import logging
+import uuid
+
+from PIL import Image as PILImage, ImageOps
+
+from app.core.config import settings
+from app.models.base import AsyncSessionLocal
+from app.models.image import Image
+from app.services.image_service import (
+    _fetch_image_bytes,
+    difference_hash,
+    fit_within,
+    media_type_for_format,
+    run_in_image_pool,
+)
+from app.services.response_cache import bump_room_version
+from app.services.storage import storage_service
+
+logger = logging.getLogger(__name__)
+
+EXIF_ORIENTATION_TAG = 0x0112
+
+# Gallery thumbnail renditions: name -> longest side in px
+THUMBNAIL_SIZES = {"sm": 320, "md": 960}
+
+def _encode_jpeg(img: PILImage.Image, quality: int) -> bytes:
+    buffer = io.BytesIO()
+    img.convert("RGB").save(buffer, format="JPEG", quality=quality, optimize=True)
+    return buffer.getvalue()
+
+
+def _render_thumbnails(img: PILImage.Image) -> dict[str, bytes]:
+    """Renders every THUMBNAIL_SIZES rendition, largest first so each is resampled from the previous one."""
+    thumbnails = {}
+    current = img
+    for name, max_size in sorted(THUMBNAIL_SIZES.items(), key=lambda item: -item[1]):
+        current = current.copy()
+        current.thumbnail((max_size, max_size), PILImage.Resampling.LANCZOS)
+        thumbnails[name] = _encode_jpeg(current, quality=80)
+    return thumbnails
+
+
+def _build_result_thumbnails(image_content: bytes) -> dict[str, bytes]:
+    with PILImage.open(io.BytesIO(image_content)) as img:
+        img.draft("RGB", (max(THUMBNAIL_SIZES.values()),) * 2)
+        return _render_thumbnails(ImageOps.exif_transpose(img))
+
+
+async def _upload_thumbnails(prefix: str, thumbnails: dict[str, bytes]) -> dict[str, str]:
+    uploads = [
+        storage_service.upload_file(settings.BUCKET_THUMBNAILS, f"{prefix}/{name}.jpg", data, "image/jpeg")
+        for name, data in thumbnails.items()
+    ]
+    urls = await asyncio.gather(*uploads)
+    return dict(zip(thumbnails.keys(), urls))
+
+
+def _build_derivatives(image_content: bytes) -> dict:
+    """
+    Decodes the upload once and derives everything later stages need from it:
+    metadata, the perceptual hash, the model-input rendition and gallery thumbnails.
+
+    The model-input rendition keeps the original pixel orientation (exactly what
+    the pipeline used to produce on the fly) and is only created when the
+    original is larger than MODEL_INPUT_MAX_SIZE or not a format the models accept.
+    Thumbnails are rotated upright for display.
+    """
+    with PILImage.open(io.BytesIO(image_content)) as img:
+        width, height = img.size
+        media_type = media_type_for_format(img.format)
+        orientation = img.getexif().get(EXIF_ORIENTATION_TAG, 1)
+
+        # JPEG DCT scaling: decode directly at (at least) the model-input size
+        model_size = fit_within(width, height)
+        img.draft("RGB", model_size)
+        img.load()
+
+        model_input = None
+        if model_size != (width, height) or media_type is None:
+            model_img = img.resize(model_size, PILImage.Resampling.LANCZOS) if img.size != model_size else img
+            model_input = _encode_jpeg(model_img, quality=90)
+        else:
+            model_img = img
+
+        thumbnails = _render_thumbnails(ImageOps.exif_transpose(model_img))
+        phash = difference_hash(model_img)
+
+    return {
+        "width": width,
+        "height": height,
+        "format": media_type,
+        "orientation": orientation,
+        "phash": phash,
+        "model_input": model_input,
+        "thumbnails": thumbnails,
+    }
+
+
+async def process_uploaded_image(image_id: uuid.UUID):
+    """
+    Post-upload pass run in the background after the upload response is sent.
+    Fills in the metadata that cannot be read from the header bytes alone and
+    stores the derivatives in the thumbnails bucket, so resampling happens once
+    per upload instead of once per job and stage.
+    """
+    async with AsyncSessionLocal() as session:
+        db_image = await session.get(Image, image_id)
+        if not db_image:
+            logger.warning(f"Image {image_id} disappeared before post-upload processing")
+            return
+
+        try:
+            image_content = await _fetch_image_bytes(db_image.original_url)
+            derivatives = await run_in_image_pool(_build_derivatives, image_content)
+
+            if derivatives["model_input"]:
+                db_image.model_input_url = await storage_service.upload_file(
+                    settings.BUCKET_THUMBNAILS,
+                    f"{image_id}/model.jpg",
+                    derivatives["model_input"],
+                    "image/jpeg"
+                )
+
+            db_image.thumbnails = await _upload_thumbnails(str(image_id), derivatives["thumbnails"])
+        except Exception as e:
+            logger.error(f"Error processing uploaded image {image_id}: {e}")
+            return
+
+        db_image.phash = derivatives["phash"]
+        if not db_image.width or not db_image.height:
+            db_image.width = derivatives["width"]
+            db_image.height = derivatives["height"]
+        if db_image.orientation is None:
+            db_image.orientation = derivatives["orientation"]
+        if derivatives["format"]:
+            db_image.format = derivatives["format"]
+        await session.commit()
+        # Thumbnails and dimensions show up in the property/room views
+        await bump_room_version(session, db_image.room_id)
+
+
+async def create_result_thumbnails(job_id: str, image_content: bytes) -> dict[str, str] | None:
+    """
+    Renders and stores the gallery thumbnails of a finished staging result.
+    Failures are logged and return None; a missing thumbnail must never fail the job.
+    """
+    try:
+        thumbnails = await run_in_image_pool(_build_result_thumbnails, image_content)
+        return await _upload_thumbnails(f"results/{job_id}", thumbnails)
+    except Exception as e:
+        logger.error(f"Error creating thumbnails for job {job_id}: {e}")
+        return None
+
+
+async def delete_image_derivatives(db_image: Image):
+    """Removes the model-input rendition and thumbnails of an image from storage."""
+    object_names = [f"{db_image.id}/{name}.jpg" for name in (db_image.thumbnails or {})]
+    if db_image.model_input_url:
+        object_names.append(f"{db_image.id}/model.jpg")
+    for object_name in object_names:
+        try:
+            await storage_service.delete_file(settings.BUCKET_THUMBNAILS, object_name)
+        except Exception as e:
+            logger.error(f"Error deleting derivative {object_name} from storage: {e}")
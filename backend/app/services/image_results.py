@@ -0,0 +1,22 @@
+from sqlalchemy import select, update
+
+from app.models.image import Image
+from app.models.job import Job
+
+
+async def refresh_latest_completed_job(session, image_id):
+    """
+    Recomputes Image.latest_completed_job_id from the image's jobs. Called
+    whenever a job completes or is deleted, so readers never have to scan an
+    image's job history to find its current result.
+    """
+    latest = (
+        select(Job.id)
+        .where(Job.image_id == image_id, Job.status == "completed", Job.result_url.isnot(None))
+        .order_by(Job.created_at.desc())
+        .limit(1)
+        .scalar_subquery()
+    )
+    await session.execute(
+        update(Image).where(Image.id == image_id).values(latest_completed_job_id=latest)
+    )
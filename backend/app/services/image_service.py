@@ -2,22 +2,57 @@ import asyncio
 import base64
 import io
 import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import TYPE_CHECKING
 
-import httpx
 from PIL import Image
 
 from app.core.config import settings
+from app.services.http_client import RETRY_STATUS_CODES, get_http_client, request_with_retry
+from app.services.model_clients import openrouter_clients, vertex_clients
+from app.services.rate_limiter import provider_slot
+
+if TYPE_CHECKING:
+    from app.services.image_cache import ImageContext
 
 logger = logging.getLogger(__name__)
 
+# Pillow releases the GIL while decoding, resampling and encoding, so a thread
+# pool gives real parallelism without the fork/pickle cost of a process pool.
+# Every Pillow path runs here: the worker's event loop is shared by all its jobs.
+image_pool = ThreadPoolExecutor(
+    max_workers=settings.IMAGE_PROCESSING_THREADS,
+    thread_name_prefix="image-processing",
+)
+
+
+async def run_in_image_pool(func, *args):
+    """Runs CPU-bound image work on the image thread pool, off the event loop."""
+    return await asyncio.get_running_loop().run_in_executor(image_pool, func, *args)
 
-async def _fetch_and_encode_image(image_url: str) -> tuple[str, str, int, int]:
+
+def difference_hash(img: Image.Image) -> str:
     """
-    Helper to fetch image from URL (handling internal/MinIO URLs).
-    - Resizes image if either dimension > 2160px.
-    - Returns (media_type, base64_string, width, height).
+    Perceptual hash (64-bit dHash, 16 hex chars) of an opened image.
+    Compares neighbouring pixels of a 9x8 grayscale copy.
+    """
+    small = img.convert("L").resize((9, 8), Image.Resampling.BILINEAR)
+    pixels = list(small.getdata())
+
+    value = 0
+    for row in range(8):
+        for col in range(8):
+            left = pixels[row * 9 + col]
+            right = pixels[row * 9 + col + 1]
+            value = (value << 1) | (1 if left > right else 0)
+    return f"{value:016x}"
+
+
+def _split_storage_url(image_url: str) -> tuple[str, str] | None:
+    """
+    Maps an internal or public storage URL to (bucket, object_name).
+    Returns None for URLs that do not point at our storage.
     """
-    image_content = None
     from app.services.storage import storage_service
 
     internal_prefix = f"{storage_service.get_protocol()}://{settings.STORAGE_ENDPOINT}/"
@@ -32,40 +67,143 @@ async def _fetch_and_encode_image(image_url: str) -> tuple[str, str, int, int]:
     if target_prefix:
         path_parts = image_url.replace(target_prefix, "").split("/", 1)
         if len(path_parts) == 2:
-            bucket, object_name = path_parts
-            image_content = storage_service.get_object_data(bucket, object_name)
+            return path_parts[0], path_parts[1]
+    return None
+
+
+async def _fetch_image_bytes(image_url: str) -> bytes:
+    """
+    Fetches the raw image bytes, reading directly from storage for our own URLs.
+    """
+    from app.services.storage import storage_service
 
-    if image_content is None:
-        async with httpx.AsyncClient() as client:
-            image_response = await client.get(image_url)
-            image_response.raise_for_status()
-            image_content = image_response.content
+    location = _split_storage_url(image_url)
+    if location:
+        bucket, object_name = location
+        return await storage_service.get_object_data(bucket, object_name)
+
+    image_response = await request_with_retry("GET", image_url)
+    return image_response.content
+
+
+async def _fetch_image_etag(image_url: str) -> str | None:
+    """
+    Returns the ETag of the image without downloading it, or None if unavailable.
+    """
+    from app.services.storage import storage_service
+
+    try:
+        location = _split_storage_url(image_url)
+        if location:
+            bucket, object_name = location
+            return await storage_service.get_object_etag(bucket, object_name)
+
+        head_response = await get_http_client().head(image_url)
+        head_response.raise_for_status()
+        return head_response.headers.get("etag")
+    except Exception as e:
+        logger.warning(f"Could not read ETag for {image_url}: {e}")
+        return None
+
+
+MODEL_INPUT_MAX_SIZE = 2160
+
+SUPPORTED_MEDIA_TYPES = {
+    "JPEG": "image/jpeg",
+    "PNG": "image/png",
+    "WEBP": "image/webp",
+}
+
+
+def fit_within(width: int, height: int, max_size: int = MODEL_INPUT_MAX_SIZE) -> tuple[int, int]:
+    """
+    Size of the image after downscaling it to fit a max_size box (aspect preserved).
+    Used both to produce renditions and to predict their size from stored dimensions.
+    """
+    if width <= max_size and height <= max_size:
+        return width, height
+    scale = max_size / max(width, height)
+    return max(1, round(width * scale)), max(1, round(height * scale))
+
+
+def media_type_for_format(image_format: str | None) -> str | None:
+    """Maps a Pillow format name to a media type the models accept, or None."""
+    return SUPPORTED_MEDIA_TYPES.get(image_format or "")
+
+
+def _encode_image(
+    image_content: bytes,
+    known_size: tuple[int, int] | None = None,
+    known_media_type: str | None = None,
+) -> tuple[bytes, str, int, int]:
+    """
+    Resizes image if either dimension > 2160px.
+    Returns (encoded_bytes, media_type, width, height).
+    If the size and media type are already known (stored at upload) and no resize
+    is needed, the bytes are passed through without decoding them again.
+    """
+    if known_size and known_media_type in SUPPORTED_MEDIA_TYPES.values():
+        width, height = known_size
+        if 0 < width <= MODEL_INPUT_MAX_SIZE and 0 < height <= MODEL_INPUT_MAX_SIZE:
+            return image_content, known_media_type, width, height
 
     try:
         with Image.open(io.BytesIO(image_content)) as img:
             width, height = img.size
-            if width > 2160 or height > 2160:
-                img.thumbnail((2160, 2160), Image.Resampling.LANCZOS)
-                width, height = img.size
+            media_type = media_type_for_format(img.format) or "image/jpeg"
+            if width > MODEL_INPUT_MAX_SIZE or height > MODEL_INPUT_MAX_SIZE:
+                width, height = fit_within(width, height)
+                fmt = img.format if img.format else "JPEG"
+                img.draft(img.mode, (width, height))
+                resized = img.resize((width, height), Image.Resampling.LANCZOS)
 
                 buffer = io.BytesIO()
-                fmt = img.format if img.format else "JPEG"
-                img.save(buffer, format=fmt)
+                resized.save(buffer, format=fmt)
                 image_content = buffer.getvalue()
 
-            media_type = "image/jpeg"
-            if img.format == "PNG":
-                media_type = "image/png"
-            elif img.format == "WEBP":
-                media_type = "image/webp"
-
-            image_base64 = base64.b64encode(image_content).decode("utf-8")
-            return media_type, image_base64, width, height
+            return image_content, media_type, width, height
 
     except Exception as e:
         logger.error(f"Error processing image with Pillow: {e}")
-        image_base64 = base64.b64encode(image_content).decode("utf-8")
-        return "image/jpeg", image_base64, 0, 0
+        return image_content, "image/jpeg", 0, 0
+
+
+async def _fetch_and_encode_image(image_url: str, image_context: "ImageContext | None" = None) -> tuple[str, str, int, int]:
+    """
+    Helper to fetch image from URL (handling internal/MinIO URLs).
+    - Resizes image if either dimension > 2160px.
+    - Returns (media_type, base64_string, width, height).
+    - When an image_context is given, the image is fetched and encoded at most once per context.
+    """
+    if image_context is not None:
+        encoded = await image_context.get(image_url)
+        return encoded.media_type, encoded.base64, encoded.width, encoded.height
+
+    image_content = await _fetch_image_bytes(image_url)
+    encoded_content, media_type, width, height = await run_in_image_pool(_encode_image, image_content)
+    image_base64 = base64.b64encode(encoded_content).decode("utf-8")
+    return media_type, image_base64, width, height
+
+
+def _match_original_size(generated_bytes: bytes, width: int, height: int) -> bytes:
+    """Resizes a generated image to the original photo's size, re-encoded as JPEG."""
+    with Image.open(io.BytesIO(generated_bytes)) as gen_img:
+        if gen_img.size != (width, height):
+            logger.info(f"Resizing generated image from {gen_img.size} to ({width}, {height})")
+            gen_img = gen_img.resize((width, height), Image.Resampling.LANCZOS)
+        buffer = io.BytesIO()
+        gen_img.save(buffer, format="JPEG")
+        return buffer.getvalue()
+
+
+def _is_auth_error(error: Exception) -> bool:
+    """True for credential failures that warrant rebuilding the cached Vertex client."""
+    try:
+        from google.api_core import exceptions as api_exceptions
+        from google.auth import exceptions as auth_exceptions
+    except ImportError:
+        return False
+    return isinstance(error, (auth_exceptions.GoogleAuthError, api_exceptions.Unauthenticated, api_exceptions.PermissionDenied))
 
 
 async def generate_image_v1(
@@ -73,23 +211,15 @@ async def generate_image_v1(
     original_image_url: str | None = None,
     fix_white_balance: bool = False,
     reference_image_url: str | None = None,
+    image_context: "ImageContext | None" = None,
 ) -> bytes:
     """
     Generates an image using OpenRouter (Gemini chat completions with image modality).
     Returns the raw binary content of the generated image.
     """
     try:
-        api_key = settings.OPENROUTER_API_KEY
-        headers = {
-            "Authorization": f"Bearer {api_key}",
-            "Content-Type": "application/json",
-            "HTTP-Referer": "https://stage-master.app",
-            "X-Title": "Stage Master",
-        }
-
-        model = settings.LITELLM_GENERATION_MODEL
-        if model.startswith("openrouter/"):
-            model = model.replace("openrouter/", "")
+        headers = openrouter_clients.headers
+        model = openrouter_clients.model
 
         messages_content = []
         orig_width, orig_height = 0, 0
@@ -102,7 +232,7 @@ async def generate_image_v1(
                     "text": "\n\nCONSISTENCY REFERENCE (Staged Angle):\nThis image shows the EXISTING furniture and style from another angle of the same room.\nUse this ONLY to identify the inventory of items to be placed (materials, styles, exact objects).\nDo NOT copy the camera angle, wall positions, or room geometry from this reference.",
                 }
             )
-            ref_media_type, ref_image_base64, _, _ = await _fetch_and_encode_image(reference_image_url)
+            ref_media_type, ref_image_base64, _, _ = await _fetch_and_encode_image(reference_image_url, image_context)
             messages_content.append(
                 {"type": "image_url", "image_url": {"url": f"data:{ref_media_type};base64,{ref_image_base64}"}}
             )
@@ -115,7 +245,7 @@ async def generate_image_v1(
                     "text": "THE TARGET IMAGE (IMMUTABLE BACKGROUND):\nThis is the room photograph you are editing. The following are LOCKED and must appear at their EXACT pixel positions in your output:\n- Every wall edge, corner, and angle\n- Every door, doorway, and archway (position, size, open/closed state)\n- Every window (position, size, view through it)\n- All ceiling fixtures (lights, fans, vents)\n- All wall fixtures (outlets, switches, thermostats)\n- The camera angle, height, tilt, and lens perspective\n- The floor plane and ceiling line\nDo NOT move, warp, resize, crop, or alter ANY of these elements.",
                 }
             )
-            media_type, image_base64, width, height = await _fetch_and_encode_image(original_image_url)
+            media_type, image_base64, width, height = await _fetch_and_encode_image(original_image_url, image_context)
             orig_width, orig_height = width, height
             messages_content.append(
                 {"type": "image_url", "image_url": {"url": f"data:{media_type};base64,{image_base64}"}}
@@ -153,15 +283,17 @@ async def generate_image_v1(
 
         logger.info(f"Calling OpenRouter Chat API for image generation with model: {model}")
 
-        async with httpx.AsyncClient() as client:
-            response = await client.post(
+        # 429s are left to the governor (backoff across workers, job retry) instead of retried in place
+        async with provider_slot("openrouter", model):
+            response = await request_with_retry(
+                "POST",
                 "https://openrouter.ai/api/v1/chat/completions",
+                retry_status_codes=RETRY_STATUS_CODES - {429},
                 headers=headers,
                 json=payload,
-                timeout=60.0,
+                timeout=settings.OPENROUTER_TIMEOUT_SECONDS,
             )
-            response.raise_for_status()
-            result = response.json()
+        result = response.json()
 
         if not result.get("choices"):
             raise ValueError(f"No choices in response: {result}")
@@ -180,19 +312,11 @@ async def generate_image_v1(
             header, encoded = image_url.split(",", 1)
             generated_bytes = base64.b64decode(encoded)
         else:
-            async with httpx.AsyncClient() as client:
-                img_resp = await client.get(image_url)
-                img_resp.raise_for_status()
-                generated_bytes = img_resp.content
+            img_resp = await request_with_retry("GET", image_url)
+            generated_bytes = img_resp.content
 
         if orig_width > 0 and orig_height > 0:
-            with Image.open(io.BytesIO(generated_bytes)) as gen_img:
-                if gen_img.size != (orig_width, orig_height):
-                    logger.info(f"Resizing generated image from {gen_img.size} to ({orig_width}, {orig_height})")
-                    gen_img = gen_img.resize((orig_width, orig_height), Image.Resampling.LANCZOS)
-                buffer = io.BytesIO()
-                gen_img.save(buffer, format="JPEG")
-                generated_bytes = buffer.getvalue()
+            generated_bytes = await run_in_image_pool(_match_original_size, generated_bytes, orig_width, orig_height)
 
         return generated_bytes
 
@@ -206,47 +330,27 @@ async def generate_image_v2(
     original_image_url: str | None = None,
     fix_white_balance: bool = False,
     reference_image_url: str | None = None,
+    image_context: "ImageContext | None" = None,
 ) -> bytes:
     """
     Generates an image using Vertex AI Imagen with RawReferenceImage support.
     Returns the raw binary content of the generated image.
     """
     try:
-        import json
-
-        import vertexai
         from vertexai.preview.vision_models import (
             Image as VertexImage,
-            ImageGenerationModel,
             RawReferenceImage,
         )
 
-        credentials = None
-        projectId = settings.GOOGLE_CLOUD_PROJECT
-        if settings.GOOGLE_SERVICE_ACCOUNT_JSON:
-            from google.oauth2 import service_account
-
-            json_creds = json.loads(settings.GOOGLE_SERVICE_ACCOUNT_JSON)
-            projectId = json_creds.get("project_id", projectId)
-            credentials = service_account.Credentials.from_service_account_info(
-                json_creds,
-                scopes=["https://www.googleapis.com/auth/cloud-platform"],
-            )
-
-        vertexai.init(
-            project=projectId,
-            location=settings.GOOGLE_CLOUD_LOCATION,
-            credentials=credentials,
-        )
-
-        generation_model = ImageGenerationModel.from_pretrained(settings.VERTEX_IMAGEN_MODEL)
+        loop = asyncio.get_running_loop()
+        generation_model = await loop.run_in_executor(None, vertex_clients.get_imagen_model)
 
         reference_images = []
         orig_width, orig_height = 0, 0
         ref_id = 1
 
         if original_image_url:
-            _, image_base64, orig_width, orig_height = await _fetch_and_encode_image(original_image_url)
+            _, image_base64, orig_width, orig_height = await _fetch_and_encode_image(original_image_url, image_context)
             reference_images.append(
                 RawReferenceImage(
                     reference_id=ref_id,
@@ -256,7 +360,7 @@ async def generate_image_v2(
             ref_id += 1
 
         if reference_image_url:
-            _, ref_image_base64, _, _ = await _fetch_and_encode_image(reference_image_url)
+            _, ref_image_base64, _, _ = await _fetch_and_encode_image(reference_image_url, image_context)
             reference_images.append(
                 RawReferenceImage(
                     reference_id=ref_id,
@@ -298,35 +402,31 @@ async def generate_image_v2(
 
         logger.info(f"Selected aspect ratio {aspect_ratio} for original size {orig_width}x{orig_height}")
 
-        loop = asyncio.get_event_loop()
-        images = await loop.run_in_executor(
-            None,
-            lambda: generation_model._generate_images(
-                prompt=full_prompt,
-                number_of_images=1,
-                negative_prompt="distorted walls, moved doors, changed camera angle, altered room geometry, shifted windows",
-                aspect_ratio=aspect_ratio,
-                person_generation="dont_allow",
-                safety_filter_level="",
-                reference_images=reference_images if reference_images else None,
-            ),
-        )
+        async with provider_slot("vertex", settings.VERTEX_IMAGEN_MODEL):
+            images = await loop.run_in_executor(
+                None,
+                lambda: generation_model._generate_images(
+                    prompt=full_prompt,
+                    number_of_images=1,
+                    negative_prompt="distorted walls, moved doors, changed camera angle, altered room geometry, shifted windows",
+                    aspect_ratio=aspect_ratio,
+                    person_generation="dont_allow",
+                    safety_filter_level="",
+                    reference_images=reference_images if reference_images else None,
+                ),
+            )
 
         generated_bytes = images[0]._image_bytes
 
         if orig_width > 0 and orig_height > 0:
-            with Image.open(io.BytesIO(generated_bytes)) as gen_img:
-                if gen_img.size != (orig_width, orig_height):
-                    logger.info(f"Resizing generated image from {gen_img.size} to ({orig_width}, {orig_height})")
-                    gen_img = gen_img.resize((orig_width, orig_height), Image.Resampling.LANCZOS)
-                buffer = io.BytesIO()
-                gen_img.save(buffer, format="JPEG")
-                generated_bytes = buffer.getvalue()
+            generated_bytes = await run_in_image_pool(_match_original_size, generated_bytes, orig_width, orig_height)
 
         return generated_bytes
 
     except Exception as e:
         logger.error(f"Error generating image via Vertex AI: {str(e)}")
+        if _is_auth_error(e):
+            vertex_clients.invalidate()
         raise
 
 
@@ -336,6 +436,7 @@ async def generate_image(
     fix_white_balance: bool = False,
     reference_image_url: str | None = None,
     model: str = "v2",
+    image_context: "ImageContext | None" = None,
 ) -> bytes:
     """
     Generates a staged room image.
@@ -344,5 +445,5 @@ async def generate_image(
         model: "v1" uses OpenRouter, "v2" uses Vertex AI Imagen (default).
     """
     if model == "v1":
-        return await generate_image_v1(prompt, original_image_url, fix_white_balance, reference_image_url)
-    return await generate_image_v2(prompt, original_image_url, fix_white_balance, reference_image_url)
+        return await generate_image_v1(prompt, original_image_url, fix_white_balance, reference_image_url, image_context)
+    return await generate_image_v2(prompt, original_image_url, fix_white_balance, reference_image_url, image_context)
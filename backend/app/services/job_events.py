@@ -0,0 +1,136 @@
+import json
+import logging
+import uuid
+from datetime import datetime
+from typing import AsyncIterator
+
+from app.core.config import settings
+from app.services.redis_client import get_redis
+
+logger = logging.getLogger(__name__)
+
+TERMINAL_STATUSES = ("completed", "error")
+
+# Fields the worker updates while a job runs; the big LLM text columns are never cached or streamed
+EVENT_FIELDS = (
+    "status", "progress_percent", "current_step", "error_message",
+    "result_url", "thumbnails", "started_at", "completed_at", "retry_count",
+)
+
+
+def _channel(job_id: str) -> str:
+    return f"job:{job_id}:events"
+
+
+def _snapshot_key(job_id: str) -> str:
+    return f"job:{job_id}:snapshot"
+
+
+def _snapshot_ttl(fields: dict) -> int:
+    if fields.get("status") in TERMINAL_STATUSES:
+        return settings.JOB_EVENTS_TERMINAL_TTL_SECONDS
+    return settings.JOB_EVENTS_TTL_SECONDS
+
+
+def _json_default(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, uuid.UUID):
+        return str(value)
+    raise TypeError(f"Cannot serialize {type(value).__name__}")
+
+
+def _dumps(value) -> str:
+    return json.dumps(value, default=_json_default)
+
+
+async def publish_job_event(job_id: str, **fields):
+    """
+    Publishes a progress update for a job and merges it into the job's status
+    snapshot, so both streaming clients and status reads see it without a
+    database query. Failures are logged only; progress reporting must never
+    fail a job.
+    """
+    job_id = str(job_id)
+    fields = {name: value for name, value in fields.items() if name in EVENT_FIELDS}
+    if not fields:
+        return
+    encoded = {name: _dumps(value) for name, value in fields.items()}
+    try:
+        redis = get_redis()
+        async with redis.pipeline(transaction=True) as pipe:
+            pipe.hset(_snapshot_key(job_id), mapping=encoded)
+            pipe.expire(_snapshot_key(job_id), _snapshot_ttl(fields))
+            pipe.publish(_channel(job_id), _dumps(fields))
+            await pipe.execute()
+    except Exception as e:
+        logger.warning(f"Could not publish progress for job {job_id}: {e}")
+
+
+async def get_job_snapshot(job_id: str) -> dict | None:
+    """
+    Returns the cached status of a job (the JobRead fields), or None when the
+    cache only holds partial progress or nothing at all.
+    """
+    raw = await get_redis().hgetall(_snapshot_key(str(job_id)))
+    if "id" not in raw:
+        return None
+    return {name: json.loads(value) for name, value in raw.items()}
+
+
+async def seed_job_snapshot(job_id: str, fields: dict):
+    """
+    Caches a job status loaded from the database. Fields already in the cache
+    came from the worker and are at least as recent, so they are kept.
+    """
+    key = _snapshot_key(str(job_id))
+    redis = get_redis()
+    async with redis.pipeline(transaction=True) as pipe:
+        for name, value in fields.items():
+            pipe.hsetnx(key, name, _dumps(value))
+        pipe.expire(key, _snapshot_ttl(fields))
+        await pipe.execute()
+
+
+async def forget_job(job_id: str):
+    await get_redis().delete(_snapshot_key(str(job_id)))
+
+
+def format_sse(data: dict, event: str = "progress") -> str:
+    return f"event: {event}\ndata: {_dumps(data)}\n\n"
+
+
+async def job_event_stream(job_id: str, snapshot: dict) -> AsyncIterator[str]:
+    """
+    Yields Server-Sent Events for a job: the current snapshot first, then every
+    published update until the job reaches a terminal status. Sends a comment
+    line as keep-alive so proxies do not close an idle stream.
+    """
+    job_id = str(job_id)
+    if snapshot.get("status") in TERMINAL_STATUSES:
+        yield format_sse(snapshot)
+        return
+
+    pubsub = get_redis().pubsub()
+    try:
+        await pubsub.subscribe(_channel(job_id))
+        # Re-read after subscribing so an update published in between is not lost
+        snapshot = await get_job_snapshot(job_id) or snapshot
+        yield format_sse(snapshot)
+        if snapshot.get("status") in TERMINAL_STATUSES:
+            return
+
+        while True:
+            message = await pubsub.get_message(
+                ignore_subscribe_messages=True,
+                timeout=settings.JOB_EVENTS_KEEPALIVE_SECONDS,
+            )
+            if message is None:
+                yield ": keep-alive\n\n"
+                continue
+            event = json.loads(message["data"])
+            yield format_sse(event)
+            if event.get("status") in TERMINAL_STATUSES:
+                return
+    finally:
+        await pubsub.reset()
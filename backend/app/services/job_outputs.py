@@ -0,0 +1,38 @@
+import logging
+
+from app.core.config import settings
+from app.services.redis_client import get_redis
+
+logger = logging.getLogger(__name__)
+
+# Stage outputs a job hands to the jobs that depend on it (the other angles of
+# its room). Written as each stage finishes, so a dependent reads its
+# reference's analysis, plan and result from Redis instead of the database.
+OUTPUT_FIELDS = ("analysis", "placement_plan", "result_url")
+
+
+def _outputs_key(job_id: str) -> str:
+    return f"job:{job_id}:outputs"
+
+
+async def publish_job_outputs(job_id: str, **fields):
+    """Records the given stage outputs of a job. Failures are logged only; dependents fall back to the database."""
+    fields = {name: value for name, value in fields.items() if name in OUTPUT_FIELDS and value is not None}
+    if not fields:
+        return
+    try:
+        async with get_redis().pipeline(transaction=False) as pipe:
+            pipe.hset(_outputs_key(job_id), mapping=fields)
+            pipe.expire(_outputs_key(job_id), settings.JOB_EVENTS_TERMINAL_TTL_SECONDS)
+            await pipe.execute()
+    except Exception as e:
+        logger.warning(f"Could not publish outputs of job {job_id}: {e}")
+
+
+async def get_job_outputs(job_id: str) -> dict:
+    """The stage outputs recorded for a job so far; empty when none are (or no longer) cached."""
+    try:
+        return await get_redis().hgetall(_outputs_key(job_id))
+    except Exception as e:
+        logger.warning(f"Could not read outputs of job {job_id}: {e}")
+        return {}
@@ -0,0 +1,360 @@
+import logging
+import re
+import time
+
+from app.core.config import settings
+from app.services.job_events import publish_job_event
+from app.services.redis_client import get_redis
+
+logger = logging.getLogger(__name__)
+
+# Prioritised, per-user fair Redis queue for staging jobs.
+#
+# Jobs wait in one of two lanes: "interactive" for single jobs a user is
+# watching, "bulk" for batches. Inside a lane every user has a FIFO list of
+# job ids and the lane keeps a rotation of the users with jobs waiting, so
+# one user's 200 photos take turns with everyone else's instead of queueing
+# ahead of them. Workers serve the interactive lane QUEUE_INTERACTIVE_WEIGHT
+# times for every QUEUE_BULK_WEIGHT turns of the bulk lane (an empty lane
+# passes its turn on), so bulk work keeps moving under interactive load.
+#
+# Every transition is a Lua script, so it is atomic. Dequeueing moves the id
+# into the worker's processing list; a worker that dies leaves its ids there
+# and the next worker that notices its heartbeat expired requeues them. Jobs
+# to retry later (e.g. throttled by a model provider) wait in a sorted set
+# and go back to their lane and user once due.
+LANES = ("interactive", "bulk")
+QUEUE_PREFIX = "queue:staging"
+# RQ queue the staging jobs went through before this queue; adopted on worker start
+RQ_QUEUE_KEY = "rq:queue:staging"
+RQ_JOB_KEY = "rq:job:{rq_job_id}"
+JOBS_KEY = "queue:staging:jobs"  # Job id -> lane, user and enqueue time, while queued or running
+TURN_KEY = "queue:staging:turn"
+DELAYED_KEY = "queue:staging:delayed"  # Jobs to retry later, scored by when they are due
+WAKEUP_KEY = "queue:staging:wakeup"  # Pinged on every push so idle workers do not poll
+PROCESSING_KEY = "queue:staging:processing:{worker_id}"
+WORKERS_KEY = "queue:staging:workers"
+HEARTBEAT_KEY = "queue:staging:heartbeat:{worker_id}"
+# Jobs held back until another job finishes (e.g. other angles of a room wait
+# for its reference image). The dependency itself is recorded on the job row
+# (jobs.depends_on_job_id); these lists only hold the ids to release. Once a
+# job has finished, its FINISHED_KEY marker makes later dependents skip the wait.
+# HELD_KEY scores every held job by when it stops waiting: a dependent whose
+# job never finishes is queued anyway and runs without the inherited outputs.
+DEPENDENTS_KEY = "queue:staging:dependents:{job_id}"
+FINISHED_KEY = "queue:staging:finished:{job_id}"
+HELD_KEY = "queue:staging:held"
+
+
+def _users_key(lane: str) -> str:
+    return f"{QUEUE_PREFIX}:{lane}:users"
+
+
+def _user_jobs_key(lane: str, user_id: str) -> str:
+    return f"{QUEUE_PREFIX}:{lane}:user:{user_id}"
+
+
+def _waits_key(lane: str) -> str:
+    return f"{QUEUE_PREFIX}:{lane}:waits"
+
+
+# push(job_id, lane, user_id): appends a job to its user's list in the lane
+# and puts the user in the lane's rotation if they had nothing waiting (and
+# drops it from HELD_KEY, ARGV[1] .. ':held', if it was held).
+# KEYS[1] = JOBS_KEY, KEYS[2] = WAKEUP_KEY, ARGV[1] = QUEUE_PREFIX, ARGV[2] = now
+_LUA_PUSH = """
+local function push(job_id, lane, user_id)
+    redis.call('HSET', KEYS[1], job_id, cjson.encode({lane = lane, user_id = user_id, enqueued_at = tonumber(ARGV[2])}))
+    redis.call('ZREM', ARGV[1] .. ':held', job_id)
+    if redis.call('LPUSH', ARGV[1] .. ':' .. lane .. ':user:' .. user_id, job_id) == 1 then
+        redis.call('RPUSH', ARGV[1] .. ':' .. lane .. ':users', user_id)
+    end
+    redis.call('LPUSH', KEYS[2], 1)
+    redis.call('LTRIM', KEYS[2], 0, 99)
+end
+
+-- Pushes a job back to the lane and user it was queued with
+local function repush(job_id)
+    local meta = redis.call('HGET', KEYS[1], job_id)
+    if meta then
+        meta = cjson.decode(meta)
+        push(job_id, meta.lane, meta.user_id)
+    else
+        push(job_id, 'bulk', 'unknown')
+    end
+end
+
+local function push_all(source)
+    local moved = 0
+    local job_id = redis.call('LPOP', source)
+    while job_id do
+        repush(job_id)
+        moved = moved + 1
+        job_id = redis.call('LPOP', source)
+    end
+    return moved
+end
+"""
+
+# ARGV[3..] = job id, lane, user id triples
+_LUA_ENQUEUE = _LUA_PUSH + """
+for i = 3, #ARGV, 3 do
+    push(ARGV[i], ARGV[i + 1], ARGV[i + 2])
+end
+"""
+
+# KEYS[3] = dependents list, KEYS[4] = finished marker of the job they wait
+# for, KEYS[5] = HELD_KEY; ARGV[3] = that job's id, ARGV[4] = when to stop
+# waiting, ARGV[5..] = job id, lane, user id triples
+_LUA_HOLD = _LUA_PUSH + """
+for i = 5, #ARGV, 3 do
+    redis.call('HSET', KEYS[1], ARGV[i], cjson.encode({lane = ARGV[i + 1], user_id = ARGV[i + 2], depends_on = ARGV[3]}))
+    redis.call('RPUSH', KEYS[3], ARGV[i])
+    redis.call('ZADD', KEYS[5], ARGV[4], ARGV[i])
+end
+if redis.call('EXISTS', KEYS[4]) == 1 then
+    return push_all(KEYS[3])
+end
+return 0
+"""
+
+# KEYS[3] = HELD_KEY. Queues held jobs whose wait is over. Returns how many.
+_LUA_RELEASE_HELD = _LUA_PUSH + """
+local released = 0
+for _, job_id in ipairs(redis.call('ZRANGEBYSCORE', KEYS[3], '-inf', ARGV[2], 'LIMIT', 0, 100)) do
+    local meta = redis.call('HGET', KEYS[1], job_id)
+    if meta then
+        local depends_on = cjson.decode(meta).depends_on
+        if depends_on then
+            redis.call('LREM', ARGV[1] .. ':dependents:' .. depends_on, 1, job_id)
+        end
+    end
+    repush(job_id)
+    released = released + 1
+end
+return released
+"""
+
+# KEYS[3] = list whose jobs go back on the queue (a dead worker's processing list)
+_LUA_REQUEUE = _LUA_PUSH + """
+return push_all(KEYS[3])
+"""
+
+# KEYS[3] = processing list, KEYS[4] = DELAYED_KEY, KEYS[5] = the job's
+# dependents, KEYS[6] = its finished marker; ARGV[3] = job id, ARGV[4] = marker TTL.
+# A job scheduled for a retry keeps its bookkeeping and its dependents waiting.
+_LUA_COMPLETE = _LUA_PUSH + """
+redis.call('LREM', KEYS[3], 1, ARGV[3])
+if redis.call('ZSCORE', KEYS[4], ARGV[3]) then
+    return 0
+end
+redis.call('HDEL', KEYS[1], ARGV[3])
+redis.call('SET', KEYS[6], 1, 'EX', ARGV[4])
+return push_all(KEYS[5])
+"""
+
+# KEYS[3] = TURN_KEY, KEYS[4] = processing list, KEYS[5] = DELAYED_KEY;
+# ARGV[3], ARGV[4] = interactive and bulk weights, ARGV[5] = wait samples kept
+# per lane. Returns {job id, lane, seconds waited} or false when nothing is queued.
+_LUA_DEQUEUE = _LUA_PUSH + """
+for _, job_id in ipairs(redis.call('ZRANGEBYSCORE', KEYS[5], '-inf', ARGV[2], 'LIMIT', 0, 100)) do
+    redis.call('ZREM', KEYS[5], job_id)
+    repush(job_id)
+end
+
+local interactive, bulk = tonumber(ARGV[3]), tonumber(ARGV[4])
+local lanes = {'bulk', 'interactive'}
+if redis.call('INCR', KEYS[3]) % (interactive + bulk) < interactive then
+    lanes = {'interactive', 'bulk'}
+end
+for _, lane in ipairs(lanes) do
+    local users = ARGV[1] .. ':' .. lane .. ':users'
+    local user_id = redis.call('LPOP', users)
+    if user_id then
+        local jobs = ARGV[1] .. ':' .. lane .. ':user:' .. user_id
+        local job_id = redis.call('RPOP', jobs)
+        if redis.call('LLEN', jobs) > 0 then
+            redis.call('RPUSH', users, user_id)
+        end
+        if job_id then
+            redis.call('LPUSH', KEYS[4], job_id)
+            local waited = 0
+            local meta = redis.call('HGET', KEYS[1], job_id)
+            if meta then
+                waited = tonumber(ARGV[2]) - (cjson.decode(meta).enqueued_at or tonumber(ARGV[2]))
+            end
+            local waits = ARGV[1] .. ':' .. lane .. ':waits'
+            redis.call('LPUSH', waits, tostring(waited))
+            redis.call('LTRIM', waits, 0, tonumber(ARGV[5]) - 1)
+            return {job_id, lane, tostring(waited)}
+        end
+    end
+end
+return false
+"""
+
+
+def _triples(job_ids: list[str], lane: str, user_id) -> list[str]:
+    args = []
+    for job_id in job_ids:
+        args += [str(job_id), lane, str(user_id)]
+    return args
+
+
+async def _run_script(lua: str, keys: list[str], args: list) -> object:
+    redis = get_redis()
+    return await redis.register_script(lua)(
+        keys=[JOBS_KEY, WAKEUP_KEY, *keys],
+        args=[QUEUE_PREFIX, time.time(), *args],
+    )
+
+
+async def enqueue_many(job_ids: list[str], user_id, lane: str = "bulk", depends_on: str | None = None):
+    """
+    Queues jobs of one user in one round trip. With `depends_on`, the jobs are
+    held until that job finishes and are then released by the worker that ran
+    it, or right away if it already has. Jobs still held after
+    QUEUE_HOLD_TIMEOUT_SECONDS are queued anyway (see release_held_jobs).
+    """
+    if not job_ids:
+        return
+    step = "Waiting for reference image..." if depends_on else None
+    for job_id in job_ids:
+        await publish_job_event(job_id, status="queued", progress_percent=0.0, current_step=step)
+
+    args = _triples(job_ids, lane, user_id)
+    if depends_on:
+        keys = [DEPENDENTS_KEY.format(job_id=depends_on), FINISHED_KEY.format(job_id=depends_on), HELD_KEY]
+        deadline = time.time() + settings.QUEUE_HOLD_TIMEOUT_SECONDS
+        await _run_script(_LUA_HOLD, keys, [str(depends_on), deadline, *args])
+    else:
+        await _run_script(_LUA_ENQUEUE, [], args)
+
+
+async def queue_staging_job(job_id: str, user_id, lane: str = "interactive"):
+    logger.info(f"Queueing staging job with ID: {job_id}")
+    await enqueue_many([job_id], user_id, lane=lane)
+
+
+async def requeue_processing(worker_id: str) -> int:
+    """Puts the jobs a dead worker was running back on the queue, in their original lane."""
+    return await _run_script(_LUA_REQUEUE, [PROCESSING_KEY.format(worker_id=worker_id)], [0])
+
+
+# RQ describes a queued call as "app.services.generation.process_staging_job('<job id>')"
+_RQ_JOB_ID = re.compile(r"process_staging_job\('([^']+)'\)")
+
+
+async def adopt_rq_queue() -> int:
+    """
+    Moves staging jobs still waiting in the RQ queue into the bulk lane, in
+    their RQ order, so jobs queued before a deploy are not dropped.
+    """
+    redis = get_redis()
+    adopted = 0
+    while rq_job_id := await redis.lpop(RQ_QUEUE_KEY):
+        description = await redis.hget(RQ_JOB_KEY.format(rq_job_id=rq_job_id), "description")
+        match = _RQ_JOB_ID.search(description or "")
+        if not match:
+            logger.warning(f"Skipping RQ job {rq_job_id}: not a staging job ({description!r})")
+            continue
+        await enqueue_many([match.group(1)], settings.DEFAULT_USER_ID)
+        adopted += 1
+    return adopted
+
+
+async def release_held_jobs() -> int:
+    """
+    Queues jobs that have waited QUEUE_HOLD_TIMEOUT_SECONDS for a job that
+    never finished (e.g. lost from the queue); they run without its outputs.
+    """
+    released = await _run_script(_LUA_RELEASE_HELD, [HELD_KEY], [])
+    if released:
+        logger.warning(f"Released {released} held job(s) whose dependency did not finish in time")
+    return released
+
+
+async def dequeue(processing_key: str, timeout: float = 1.0) -> tuple[str, str, float] | None:
+    """
+    Takes the next job by lane weight and user rotation into the processing
+    list. Returns (job id, lane, seconds waited), or None if nothing was
+    queued within `timeout`.
+    """
+    keys = [TURN_KEY, processing_key, DELAYED_KEY]
+    args = [settings.QUEUE_INTERACTIVE_WEIGHT, settings.QUEUE_BULK_WEIGHT, settings.QUEUE_WAIT_SAMPLES]
+    for attempt in range(2):
+        taken = await _run_script(_LUA_DEQUEUE, keys, args)
+        if taken:
+            job_id, lane, waited = taken
+            return job_id, lane, float(waited)
+        if attempt == 0:
+            await get_redis().brpop(WAKEUP_KEY, timeout=timeout)
+    return None
+
+
+async def retry_later(job_id: str, delay: float):
+    """
+    Schedules a running job to be queued again in its lane after `delay`
+    seconds. Its dependents keep waiting for the retry.
+    """
+    await get_redis().zadd(DELAYED_KEY, {job_id: time.time() + delay})
+
+
+async def complete(processing_key: str, job_id: str):
+    """
+    Removes a job from the worker's processing list once it has run to an
+    outcome. Unless a retry is scheduled, it is marked finished and its
+    dependents are queued (whether it succeeded or not; without a result they
+    use the original reference photo). Never call this for a job interrupted
+    by shutdown: it must stay in the processing list to be requeued, and its
+    dependents must keep waiting for the run that finishes it.
+    """
+    keys = [processing_key, DELAYED_KEY, DEPENDENTS_KEY.format(job_id=job_id), FINISHED_KEY.format(job_id=job_id)]
+    released = await _run_script(_LUA_COMPLETE, keys, [job_id, settings.JOB_EVENTS_TERMINAL_TTL_SECONDS])
+    if released:
+        logger.info(f"Released {released} job(s) after job {job_id}")
+
+
+async def discard(processing_key: str, job_id: str):
+    """
+    Removes a job from the worker's processing list without finishing it, for
+    an entry this worker could not run (the job is running elsewhere, finished
+    or gone). Its dependents are left to the run that does finish it.
+    """
+    await get_redis().lrem(processing_key, 1, job_id)
+
+
+def _percentile(values: list[float], q: float) -> float | None:
+    if not values:
+        return None
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+async def queue_metrics() -> dict:
+    """Queue depth and users waiting per lane, recent wait-time percentiles, jobs awaiting a retry and jobs running."""
+    redis = get_redis()
+    lanes = {}
+    for lane in LANES:
+        users = await redis.lrange(_users_key(lane), 0, -1)
+        async with redis.pipeline(transaction=False) as pipe:
+            for user_id in users:
+                pipe.llen(_user_jobs_key(lane, user_id))
+            pipe.lrange(_waits_key(lane), 0, -1)
+            *depths, waits = await pipe.execute()
+        waits = sorted(float(w) for w in waits)
+        lanes[lane] = {
+            "depth": sum(depths),
+            "users": len(users),
+            "wait_seconds_p50": _percentile(waits, 0.5),
+            "wait_seconds_p95": _percentile(waits, 0.95),
+            "wait_seconds_max": waits[-1] if waits else None,
+            "wait_samples": len(waits),
+        }
+
+    workers = await redis.smembers(WORKERS_KEY)
+    async with redis.pipeline(transaction=False) as pipe:
+        for worker_id in workers:
+            pipe.llen(PROCESSING_KEY.format(worker_id=worker_id))
+        running = await pipe.execute()
+    retrying = await redis.zcard(DELAYED_KEY)
+    return {"lanes": lanes, "retrying": retrying, "workers": len(workers), "in_progress": sum(running)}
@@ -0,0 +1,108 @@
+import hashlib
+import json
+import logging
+import time
+
+from app.core.config import settings
+from app.services.redis_client import get_redis
+
+logger = logging.getLogger(__name__)
+
+KEY_PREFIX = "llmcache:"
+INDEX_KEY = "llmcache:index"  # Sorted set of cache keys scored by last use, for LRU eviction
+SIZES_KEY = "llmcache:sizes"  # Cache key -> size of its value in bytes
+TOTAL_KEY = "llmcache:bytes"  # Sum of SIZES_KEY, kept within LLM_CACHE_MAX_BYTES
+
+# Stores an entry and evicts the least recently used ones until the cached
+# values fit in the byte budget. Entries past their TTL have already expired
+# in Redis; they are only dropped from the bookkeeping here.
+# KEYS = INDEX_KEY, SIZES_KEY, TOTAL_KEY, entry key; ARGV = value, TTL, now, max bytes
+_LUA_PUT = """
+local ttl, now, max_bytes = tonumber(ARGV[2]), tonumber(ARGV[3]), tonumber(ARGV[4])
+local size = string.len(ARGV[1])
+if size > max_bytes then
+    return 0
+end
+
+local function forget(key)
+    local old = tonumber(redis.call('HGET', KEYS[2], key))
+    if old then
+        redis.call('HDEL', KEYS[2], key)
+        redis.call('DECRBY', KEYS[3], old)
+    end
+    redis.call('ZREM', KEYS[1], key)
+end
+
+for _, key in ipairs(redis.call('ZRANGEBYSCORE', KEYS[1], '-inf', now - ttl)) do
+    forget(key)
+end
+forget(KEYS[4])
+redis.call('SET', KEYS[4], ARGV[1], 'EX', ttl)
+redis.call('ZADD', KEYS[1], now, KEYS[4])
+redis.call('HSET', KEYS[2], KEYS[4], size)
+local total = redis.call('INCRBY', KEYS[3], size)
+
+local evicted = 0
+while total > max_bytes do
+    local oldest = redis.call('ZRANGE', KEYS[1], 0, 0)[1]
+    if not oldest then
+        break
+    end
+    forget(oldest)
+    redis.call('DEL', oldest)
+    total = tonumber(redis.call('GET', KEYS[3]))
+    evicted = evicted + 1
+end
+return evicted
+"""
+
+
+def enabled() -> bool:
+    return settings.LLM_CACHE_ENABLED and settings.LLM_CACHE_MAX_BYTES > 0
+
+
+def make_key(stage: str, model: str, template_version: str, prompt: str, image_hashes: list[str]) -> str:
+    """
+    Content-addressed cache key. The fully rendered prompt covers every parameter
+    interpolated into the template; images are identified by their content hash.
+    """
+    payload = json.dumps(
+        {
+            "stage": stage,
+            "model": model,
+            "template_version": template_version,
+            "prompt": prompt,
+            "images": image_hashes,
+        },
+        sort_keys=True,
+    )
+    return KEY_PREFIX + hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+async def get(key: str) -> str | None:
+    """Returns the cached completion or None. Cache errors are treated as a miss."""
+    try:
+        redis = get_redis()
+        value = await redis.get(key)
+        if value is not None:
+            await redis.zadd(INDEX_KEY, {key: time.time()})
+        return value
+    except Exception as e:
+        logger.warning(f"LLM cache read failed: {e}")
+        return None
+
+
+async def put(key: str, value: str):
+    """
+    Stores a completion with a TTL and evicts the least recently used entries
+    until the cached values fit in LLM_CACHE_MAX_BYTES. A value larger than
+    the whole budget is not cached.
+    """
+    try:
+        redis = get_redis()
+        await redis.register_script(_LUA_PUT)(
+            keys=[INDEX_KEY, SIZES_KEY, TOTAL_KEY, key],
+            args=[value, settings.LLM_CACHE_TTL_SECONDS, time.time(), settings.LLM_CACHE_MAX_BYTES],
+        )
+    except Exception as e:
+        logger.warning(f"LLM cache write failed: {e}")
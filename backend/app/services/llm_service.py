@@ -4,14 +4,74 @@ from typing import cast
 from litellm import ModelResponse
 from litellm.types.utils import Choices
 from app.core.config import settings
+from app.services import llm_cache
+from app.services.image_cache import ImageContext
 from app.services.image_service import _fetch_and_encode_image
+from app.services.rate_limiter import provider_slot
 
 logger = logging.getLogger(__name__)
 
 # Configure litellm
 litellm.telemetry = False
 
-async def analyze_room(image_url: str, reference_image_url: str | None = None, reference_analysis: str | None = None) -> str:
+# Bump when a prompt template changes meaning, to invalidate cached results
+ANALYSIS_PROMPT_VERSION = "1"
+PLACEMENT_PROMPT_VERSION = "1"
+GENERATION_PROMPT_VERSION = "1"
+
+async def _complete_with_images(
+    stage: str,
+    template_version: str,
+    prompt: str,
+    image_urls: list[str],
+    image_context: ImageContext | None = None
+) -> str:
+    """
+    Sends the prompt plus images to the analysis model and returns the text reply.
+    Results are cached by model, template version, rendered prompt and image
+    content hashes, so identical inputs skip the LLM round trip entirely.
+    """
+    if image_context is None:
+        image_context = ImageContext(shared_cache=None)
+    model = settings.LITELLM_ANALYSIS_MODEL
+
+    cache_key = None
+    if llm_cache.enabled():
+        image_hashes = [await image_context.content_hash(url) for url in image_urls]
+        cache_key = llm_cache.make_key(stage, model, template_version, prompt, image_hashes)
+        cached = await llm_cache.get(cache_key)
+        if cached is not None:
+            logger.info(f"LLM cache hit for {stage}")
+            return cached
+
+    content_parts = [{"type": "text", "text": prompt}]
+    for url in image_urls:
+        media_type, image_base64, _, _ = await _fetch_and_encode_image(url, image_context)
+        content_parts.append({
+            "type": "image_url",
+            "image_url": {"url": f"data:{media_type};base64,{image_base64}"}
+        })
+
+    provider, _, provider_model = model.partition("/")
+    async with provider_slot(provider, provider_model):
+        response = cast(ModelResponse, await litellm.acompletion(
+            model=model,
+            messages=[{"role": "user", "content": content_parts}],
+            api_key=settings.OPENROUTER_API_KEY
+        ))
+    content = cast(Choices, response.choices[0]).message.content
+    assert content is not None
+
+    if cache_key:
+        await llm_cache.put(cache_key, content)
+    return content
+
+async def analyze_room(
+    image_url: str,
+    reference_image_url: str | None = None,
+    reference_analysis: str | None = None,
+    image_context: ImageContext | None = None
+) -> str:
     """
     Analyzes room layout, surfaces, and depth using LiteLLM/OpenRouter.
     Returns a text description of the room analysis.
@@ -78,30 +138,10 @@ async def analyze_room(image_url: str, reference_image_url: str | None = None, r
     """
     
     try:
-        media_type, image_base64, _, _ = await _fetch_and_encode_image(image_url)
-        
-        messages = [
-            {"role": "user", "content": [
-                {"type": "text", "text": prompt},
-                {"type": "image_url", "image_url": {"url": f"data:{media_type};base64,{image_base64}"}}
-            ]}
-        ]
-
+        image_urls = [image_url]
         if reference_image_url:
-            ref_media_type, ref_image_base64, _, _ = await _fetch_and_encode_image(reference_image_url)
-            messages[0]["content"].append(
-                {"type": "image_url", "image_url": {"url": f"data:{ref_media_type};base64,{ref_image_base64}"}}
-            )
-
-        response = cast(ModelResponse, await litellm.acompletion(
-            model=settings.LITELLM_ANALYSIS_MODEL,
-            messages=messages,
-            api_key=settings.OPENROUTER_API_KEY
-        ))
-
-        content = cast(Choices, response.choices[0]).message.content
-        assert content is not None
-        return content
+            image_urls.append(reference_image_url)
+        return await _complete_with_images("analysis", ANALYSIS_PROMPT_VERSION, prompt, image_urls, image_context)
     except Exception as e:
         logger.error(f"Error calling LiteLLM for room analysis: {str(e)}")
         raise
@@ -118,7 +158,8 @@ async def plan_furniture_placement(
     include_tv: bool = False,
     target_image_url: str | None= None,
     reference_image_url: str | None = None,
-    reference_plan: str | None = None
+    reference_plan: str | None = None,
+    image_context: ImageContext | None = None
 ) -> str:
     """
     Generates a furniture placement plan based on room analysis.
@@ -198,30 +239,8 @@ async def plan_furniture_placement(
     """
     
     try:
-        messages = [{"role": "user", "content": [{"type": "text", "text": prompt}]}]
-        
-        if target_image_url:
-            media_type, image_base64, _, _ = await _fetch_and_encode_image(target_image_url)
-            messages[0]["content"].append({
-                "type": "image_url", 
-                "image_url": {"url": f"data:{media_type};base64,{image_base64}"}
-            })
-            
-        if reference_image_url:
-            ref_media_type, ref_image_base64, _, _ = await _fetch_and_encode_image(reference_image_url)
-            messages[0]["content"].append({
-                "type": "image_url", 
-                "image_url": {"url": f"data:{ref_media_type};base64,{ref_image_base64}"}
-            })
-
-        response = cast(ModelResponse, await litellm.acompletion(
-            model=settings.LITELLM_ANALYSIS_MODEL,
-            messages=messages,
-            api_key=settings.OPENROUTER_API_KEY
-        ))
-        content = cast(Choices, response.choices[0]).message.content
-        assert content is not None
-        return content
+        image_urls = [url for url in (target_image_url, reference_image_url) if url]
+        return await _complete_with_images("placement", PLACEMENT_PROMPT_VERSION, prompt, image_urls, image_context)
     except Exception as e:
         logger.error(f"Error calling LiteLLM for furniture placement: {str(e)}")
         raise
@@ -235,7 +254,8 @@ async def generate_staged_image_prompt(
     wall_decorations: bool = True,
     include_tv: bool = False,
     reference_image_url: str | None = None,
-    reference_plan: str | None = None
+    reference_plan: str | None = None,
+    image_context: ImageContext | None = None
 ) -> str:
     """
     Generates a highly detailed prompt for the image generation model (e.g., Stable Diffusion or DALL-E)
@@ -326,30 +346,8 @@ async def generate_staged_image_prompt(
     """
     
     try:
-        messages = [{"role": "user", "content": [{"type": "text", "text": prompt}]}]
-        
-        if original_image_url:
-            media_type, image_base64, _, _ = await _fetch_and_encode_image(original_image_url)
-            messages[0]["content"].append({
-                "type": "image_url", 
-                "image_url": {"url": f"data:{media_type};base64,{image_base64}"}
-            })
-            
-        if reference_image_url:
-            ref_media_type, ref_image_base64, _, _ = await _fetch_and_encode_image(reference_image_url)
-            messages[0]["content"].append({
-                "type": "image_url", 
-                "image_url": {"url": f"data:{ref_media_type};base64,{ref_image_base64}"}
-            })
-
-        response = cast(ModelResponse, await litellm.acompletion(
-            model=settings.LITELLM_ANALYSIS_MODEL,
-            messages=messages,
-            api_key=settings.OPENROUTER_API_KEY
-        ))
-        content = cast(Choices, response.choices[0]).message.content
-        assert content is not None
-        return content
+        image_urls = [url for url in (original_image_url, reference_image_url) if url]
+        return await _complete_with_images("generation_prompt", GENERATION_PROMPT_VERSION, prompt, image_urls, image_context)
     except Exception as e:
         logger.error(f"Error calling LiteLLM for generation prompt: {str(e)}")
         raise
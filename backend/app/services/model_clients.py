@@ -0,0 +1,127 @@
+import asyncio
+import json
+import logging
+import threading
+import time
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+class VertexClientRegistry:
+    """
+    Process-lifetime holder for the Vertex AI setup: parsed service account
+    credentials, vertexai.init and the Imagen model handle. Built lazily on
+    first use (or by warm_up), refreshed when the credentials expire and
+    rebuilt after VERTEX_CLIENT_TTL_SECONDS or an authentication failure.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._model = None
+        self._credentials = None
+        self._initialized_at = 0.0
+
+    def _initialize(self):
+        import vertexai
+        from vertexai.preview.vision_models import ImageGenerationModel
+
+        credentials = None
+        project_id = settings.GOOGLE_CLOUD_PROJECT
+        if settings.GOOGLE_SERVICE_ACCOUNT_JSON:
+            from google.oauth2 import service_account
+
+            json_creds = json.loads(settings.GOOGLE_SERVICE_ACCOUNT_JSON)
+            project_id = json_creds.get("project_id", project_id)
+            credentials = service_account.Credentials.from_service_account_info(
+                json_creds,
+                scopes=["https://www.googleapis.com/auth/cloud-platform"],
+            )
+
+        vertexai.init(
+            project=project_id,
+            location=settings.GOOGLE_CLOUD_LOCATION,
+            credentials=credentials,
+        )
+
+        self._model = ImageGenerationModel.from_pretrained(settings.VERTEX_IMAGEN_MODEL)
+        self._credentials = credentials
+        self._initialized_at = time.monotonic()
+        logger.info(f"Initialized Vertex AI client for {settings.VERTEX_IMAGEN_MODEL}")
+
+    def _refresh_credentials_if_needed(self):
+        if self._credentials is None or self._credentials.valid:
+            return
+        from google.auth.transport.requests import Request
+
+        logger.info("Refreshing Vertex AI credentials")
+        self._credentials.refresh(Request())
+
+    def get_imagen_model(self):
+        """Returns the shared ImageGenerationModel. Blocking; call from a thread when on the event loop."""
+        with self._lock:
+            expired = time.monotonic() - self._initialized_at > settings.VERTEX_CLIENT_TTL_SECONDS
+            if self._model is None or expired:
+                self._initialize()
+            else:
+                self._refresh_credentials_if_needed()
+            return self._model
+
+    def invalidate(self):
+        """Drops the cached client so the next call rebuilds it (e.g. after an auth error)."""
+        with self._lock:
+            self._model = None
+            self._credentials = None
+
+    async def warm_up(self):
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None, self.get_imagen_model)
+
+
+class OpenRouterClientRegistry:
+    """Process-lifetime OpenRouter settings: resolved model name and request headers."""
+
+    def __init__(self):
+        self._headers = None
+        self._model = None
+
+    @property
+    def headers(self) -> dict:
+        if self._headers is None:
+            self._headers = {
+                "Authorization": f"Bearer {settings.OPENROUTER_API_KEY}",
+                "Content-Type": "application/json",
+                "HTTP-Referer": "https://stage-master.app",
+                "X-Title": "Stage Master",
+            }
+        return self._headers
+
+    @property
+    def model(self) -> str:
+        if self._model is None:
+            model = settings.LITELLM_GENERATION_MODEL
+            if model.startswith("openrouter/"):
+                model = model.replace("openrouter/", "")
+            self._model = model
+        return self._model
+
+    async def warm_up(self):
+        self.headers
+        self.model
+
+
+vertex_clients = VertexClientRegistry()
+openrouter_clients = OpenRouterClientRegistry()
+
+
+async def warm_up_model_clients(model: str = "v2"):
+    """Pre-builds the client for the given backend so the first render does not pay the setup cost."""
+    try:
+        if model == "v1":
+            await openrouter_clients.warm_up()
+        else:
+            await vertex_clients.warm_up()
+    except Exception as e:
+        # The render stage will retry the setup and surface the error itself
+        logger.warning(f"Model client warm-up failed for {model}: {e}")
@@ -0,0 +1,71 @@
+import asyncio
+import logging
+import time
+from typing import Any, Awaitable, Callable
+
+logger = logging.getLogger(__name__)
+
+
+class StageGraph:
+    """
+    Tiny dependency graph for the staging pipeline. Each stage is a coroutine
+    function that receives the results of its dependencies as keyword
+    arguments; stages whose dependencies are satisfied run concurrently.
+    A stage given a `checkpoint` (its output saved by an earlier run) is not
+    run; it resolves to the checkpoint at once, without waiting for its
+    dependencies. Wall-clock time per stage is recorded in `timings`.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self._stages: dict[str, tuple[Callable[..., Awaitable[Any]], tuple[str, ...]]] = {}
+        self._checkpoints: dict[str, Any] = {}
+        self.timings: dict[str, float] = {}
+
+    def add(
+        self,
+        name: str,
+        func: Callable[..., Awaitable[Any]],
+        depends_on: tuple[str, ...] = (),
+        checkpoint: Any = None,
+    ):
+        for dep in depends_on:
+            if dep not in self._stages:
+                raise ValueError(f"Stage '{name}' depends on unknown stage '{dep}'")
+        self._stages[name] = (func, depends_on)
+        if checkpoint is not None:
+            self._checkpoints[name] = checkpoint
+
+    async def run(self) -> dict[str, Any]:
+        tasks: dict[str, asyncio.Task] = {}
+
+        async def run_stage(name: str):
+            if name in self._checkpoints:
+                self.timings[name] = 0.0
+                return self._checkpoints[name]
+            func, depends_on = self._stages[name]
+            inputs = {}
+            for dep in depends_on:
+                inputs[dep] = await tasks[dep]
+            started = time.perf_counter()
+            try:
+                return await func(**inputs)
+            finally:
+                self.timings[name] = round(time.perf_counter() - started, 3)
+
+        # Stages are registered in dependency order, so every dependency task exists before its dependents start
+        for name in self._stages:
+            tasks[name] = asyncio.create_task(run_stage(name), name=f"{self.name}:{name}")
+
+        try:
+            await asyncio.gather(*tasks.values())
+        except BaseException:
+            for task in tasks.values():
+                task.cancel()
+            await asyncio.gather(*tasks.values(), return_exceptions=True)
+            raise
+        finally:
+            resumed = f" (resumed: {', '.join(self._checkpoints)})" if self._checkpoints else ""
+            logger.info(f"Stage timings for {self.name}{resumed}: {self.timings}")
+
+        return {name: task.result() for name, task in tasks.items()}
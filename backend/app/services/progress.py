@@ -0,0 +1,123 @@
+import asyncio
+import logging
+import uuid
+
+from sqlalchemy import update
+from sqlalchemy.exc import InterfaceError, OperationalError, TimeoutError as PoolTimeoutError
+
+from app.core.config import settings
+from app.models.base import AsyncSessionLocal
+from app.models.job import Job
+
+logger = logging.getLogger(__name__)
+
+# Failures that mean the database is unreachable, not that a row is bad
+_DATABASE_UNAVAILABLE = (OperationalError, InterfaceError, PoolTimeoutError, OSError, asyncio.TimeoutError)
+
+
+class ProgressWriter:
+    """
+    Coalesces per-job column updates (progress, current step, stage outputs)
+    and writes them in one batched UPDATE every PROGRESS_FLUSH_INTERVAL_SECONDS,
+    on a short-lived session. Clients see progress immediately through the
+    Redis status cache/event stream; the database only needs to catch up.
+
+    State transitions must not race a flush: they `take()` the job's pending
+    fields (waiting for an in-flight flush) and write them together with the
+    new state themselves.
+
+    A failed write is retried on the next flush, up to PROGRESS_MAX_ATTEMPTS
+    times per job; updates for jobs that no longer exist are dropped.
+    """
+
+    def __init__(self, interval: float = settings.PROGRESS_FLUSH_INTERVAL_SECONDS):
+        self.interval = interval
+        self._pending: dict[str, dict] = {}
+        self._attempts: dict[str, int] = {}
+        self._lock = asyncio.Lock()
+        self._task: asyncio.Task | None = None
+
+    def update(self, job_id: str, **fields):
+        pending = self._pending.setdefault(str(job_id), {})
+        pending.update(fields)
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def take(self, job_id: str) -> dict:
+        """Removes and returns the fields not yet written for a job."""
+        async with self._lock:
+            self._attempts.pop(str(job_id), None)
+            return self._pending.pop(str(job_id), {})
+
+    async def flush(self):
+        async with self._lock:
+            pending, self._pending = self._pending, {}
+            if not pending:
+                return
+            rows = [{"id": uuid.UUID(job_id), **fields} for job_id, fields in pending.items()]
+            try:
+                async with AsyncSessionLocal() as session:
+                    # ORM bulk UPDATE by primary key: one executemany per distinct column set
+                    await session.execute(update(Job), rows)
+                    await session.commit()
+                failed = {}
+            except _DATABASE_UNAVAILABLE as e:
+                logger.warning(f"Could not write progress for {len(rows)} job(s), will retry: {e}")
+                failed = pending
+            except Exception as e:
+                logger.warning(f"Batched progress write for {len(rows)} job(s) failed, writing them one by one: {e}")
+                failed = await self._write_each(pending)
+
+            for job_id in pending.keys() - failed.keys():
+                self._attempts.pop(job_id, None)
+            for job_id, fields in failed.items():
+                attempts = self._attempts.pop(job_id, 0) + 1
+                if attempts >= settings.PROGRESS_MAX_ATTEMPTS:
+                    logger.error(f"Dropping progress of job {job_id} ({', '.join(fields)}) after {attempts} failed writes")
+                    continue
+                self._attempts[job_id] = attempts
+                # Keep anything newer that arrived while the write was failing
+                self._pending[job_id] = {**fields, **self._pending.get(job_id, {})}
+
+    async def _write_each(self, pending: dict[str, dict]) -> dict[str, dict]:
+        """
+        Writes each job's fields in its own transaction, so one bad row does
+        not hold back the others. Returns the fields that could not be written;
+        those of jobs that no longer exist are dropped.
+        """
+        failed = {}
+        for job_id, fields in pending.items():
+            try:
+                async with AsyncSessionLocal() as session:
+                    stmt = (
+                        update(Job)
+                        .where(Job.id == uuid.UUID(job_id))
+                        .values(**fields)
+                        .execution_options(synchronize_session=False)
+                    )
+                    result = await session.execute(stmt)
+                    await session.commit()
+            except Exception as e:
+                logger.warning(f"Could not write progress of job {job_id}: {e}")
+                failed[job_id] = fields
+                continue
+            if result.rowcount == 0:
+                logger.info(f"Job {job_id} no longer exists, dropped its progress")
+        return failed
+
+    async def _run(self):
+        while self._pending:
+            await asyncio.sleep(self.interval)
+            await self.flush()
+
+    async def close(self):
+        if self._task is not None:
+            # Under the lock, so a flush in progress is never cancelled halfway through
+            async with self._lock:
+                self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        await self.flush()
+
+
+progress_writer = ProgressWriter()
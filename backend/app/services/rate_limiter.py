@@ -0,0 +1,229 @@
+import asyncio
+import logging
+import random
+import time
+import uuid
+from contextlib import asynccontextmanager
+
+from app.core.config import settings
+from app.services.redis_client import get_redis
+
+logger = logging.getLogger(__name__)
+
+# Shared throttle for the model providers, held in Redis so the limits apply
+# across every worker process. Each provider (optionally each provider/model,
+# see PROVIDER_LIMITS) gets:
+#
+# - a token bucket refilled at `rate` requests per second up to `burst`.
+#   Callers reserve a token even when the bucket is empty and sleep off the
+#   debt, so waiting callers are served in order;
+# - a cap of `concurrency` calls in flight, as leases in a sorted set that
+#   expire on their own if a worker dies mid-call;
+# - AIMD on the rate: every success adds RATE_LIMIT_INCREASE_FRACTION of the
+#   configured rate, every 429 multiplies it by RATE_LIMIT_DECREASE_FACTOR
+#   and pauses the bucket for the provider's Retry-After. The rate stays
+#   between RATE_LIMIT_MIN_FRACTION of the configured rate and the rate itself.
+#
+# A call that would wait longer than RATE_LIMIT_MAX_WAIT_SECONDS raises
+# ProviderRateLimited instead, so the job is retried later rather than
+# holding a worker slot. If Redis is unavailable, calls are not throttled.
+
+# KEYS[1] = bucket; ARGV = now, configured rate, burst, max wait.
+# Returns {granted, seconds to wait}.
+_LUA_TAKE = """
+local now = tonumber(ARGV[1])
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'ts', 'rate')
+local rate = tonumber(state[3]) or tonumber(ARGV[2])
+local burst = tonumber(ARGV[3])
+local tokens = tonumber(state[1]) or burst
+local ts = tonumber(state[2]) or now
+tokens = math.min(burst, tokens + math.max(0, now - ts) * rate) - 1
+local wait = 0
+if tokens < 0 then
+    wait = -tokens / rate
+end
+if wait > tonumber(ARGV[4]) then
+    return {0, tostring(wait)}
+end
+redis.call('HSET', KEYS[1], 'tokens', tokens, 'ts', now, 'rate', rate)
+redis.call('EXPIRE', KEYS[1], 86400)
+return {1, tostring(wait)}
+"""
+
+# KEYS[1] = bucket; ARGV = now, configured rate, min rate, "increase" or
+# "decrease", increase step, decrease factor, seconds to pause. Returns the new rate.
+_LUA_ADJUST = """
+local now = tonumber(ARGV[1])
+local rate = tonumber(redis.call('HGET', KEYS[1], 'rate')) or tonumber(ARGV[2])
+if ARGV[4] == 'decrease' then
+    rate = math.max(tonumber(ARGV[3]), rate * tonumber(ARGV[6]))
+    -- Empty the bucket so nobody calls again before the pause is over
+    local tokens = -tonumber(ARGV[7]) * rate
+    local current = tonumber(redis.call('HGET', KEYS[1], 'tokens'))
+    if current then
+        local ts = tonumber(redis.call('HGET', KEYS[1], 'ts')) or now
+        tokens = math.min(tokens, current + math.max(0, now - ts) * rate)
+    end
+    redis.call('HSET', KEYS[1], 'tokens', tokens, 'ts', now)
+else
+    rate = math.min(tonumber(ARGV[2]), rate + tonumber(ARGV[5]))
+end
+redis.call('HSET', KEYS[1], 'rate', rate)
+redis.call('EXPIRE', KEYS[1], 86400)
+return tostring(rate)
+"""
+
+# KEYS[1] = leases; ARGV = now, concurrency, lease id, lease expiry. Returns 1 if acquired.
+_LUA_ACQUIRE = """
+redis.call('ZREMRANGEBYSCORE', KEYS[1], '-inf', ARGV[1])
+if redis.call('ZCARD', KEYS[1]) < tonumber(ARGV[2]) then
+    redis.call('ZADD', KEYS[1], ARGV[4], ARGV[3])
+    redis.call('EXPIRE', KEYS[1], 86400)
+    return 1
+end
+return 0
+"""
+
+
+class ProviderRateLimited(Exception):
+    """A provider call was throttled, locally or by the provider; the job should be retried later."""
+
+    def __init__(self, message: str, retry_after: float | None = None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+def _limits(provider: str, model: str) -> dict:
+    limits = settings.PROVIDER_LIMITS
+    return {
+        **limits.get("default", {}),
+        **limits.get(provider, {}),
+        **limits.get(f"{provider}/{model}", {}),
+    }
+
+
+def retry_after_seconds(error: Exception) -> float | None:
+    """The delay a throttling error asks for (Retry-After), if it carries one."""
+    if isinstance(error, ProviderRateLimited):
+        return error.retry_after
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None)
+    if headers is not None:
+        value = headers.get("retry-after")
+        if value and value.isdigit():
+            return float(value)
+    return None
+
+
+def is_rate_limited(error: Exception) -> bool:
+    """Whether an error means the provider is throttling us (429 or an exhausted quota)."""
+    if isinstance(error, ProviderRateLimited):
+        return True
+    status_code = getattr(getattr(error, "response", None), "status_code", None)
+    if status_code is None:
+        status_code = getattr(error, "status_code", None)
+    if status_code == 429:
+        return True
+    try:
+        from google.api_core import exceptions as api_exceptions
+    except ImportError:
+        return False
+    return isinstance(error, (api_exceptions.ResourceExhausted, api_exceptions.TooManyRequests))
+
+
+async def _run_script(lua: str, key: str, *args):
+    return await get_redis().register_script(lua)(keys=[key], args=list(args))
+
+
+class ProviderGovernor:
+    """Rate and concurrency limits of one provider/model, shared through Redis."""
+
+    def __init__(self, provider: str, model: str):
+        self.name = f"{provider}/{model}"
+        self.limits = _limits(provider, model)
+        self.bucket_key = f"ratelimit:{self.name}:bucket"
+        self.leases_key = f"ratelimit:{self.name}:leases"
+
+    async def _take_token(self, deadline: float):
+        rate = self.limits["rate"]
+        max_wait = max(0.0, deadline - time.monotonic())
+        granted, wait = await _run_script(_LUA_TAKE, self.bucket_key, time.time(), rate, self.limits["burst"], max_wait)
+        wait = float(wait)
+        if not int(granted):
+            raise ProviderRateLimited(f"{self.name} rate limit: next slot in {wait:.0f}s", retry_after=wait)
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+    async def _acquire_lease(self, deadline: float) -> str:
+        lease_id = uuid.uuid4().hex
+        while True:
+            now = time.time()
+            expiry = now + settings.STAGING_JOB_TIMEOUT_SECONDS
+            if int(await _run_script(_LUA_ACQUIRE, self.leases_key, now, self.limits["concurrency"], lease_id, expiry)):
+                return lease_id
+            if time.monotonic() >= deadline:
+                raise ProviderRateLimited(f"{self.name} concurrency limit reached")
+            await asyncio.sleep(random.uniform(0.1, 0.5))
+
+    async def _adjust(self, mode: str, pause: float = 0.0):
+        rate = self.limits["rate"]
+        new_rate = await _run_script(
+            _LUA_ADJUST,
+            self.bucket_key,
+            time.time(),
+            rate,
+            rate * settings.RATE_LIMIT_MIN_FRACTION,
+            mode,
+            rate * settings.RATE_LIMIT_INCREASE_FRACTION,
+            settings.RATE_LIMIT_DECREASE_FACTOR,
+            pause,
+        )
+        if mode == "decrease":
+            logger.warning(f"{self.name} throttled us; rate lowered to {float(new_rate):.3f}/s, paused {pause:.0f}s")
+
+    @asynccontextmanager
+    async def slot(self):
+        """Waits for a token and a concurrency slot, then adapts the rate to how the call went."""
+        deadline = time.monotonic() + settings.RATE_LIMIT_MAX_WAIT_SECONDS
+        lease_id = None
+        try:
+            await self._take_token(deadline)
+            lease_id = await self._acquire_lease(deadline)
+        except ProviderRateLimited:
+            raise
+        except Exception as e:
+            logger.warning(f"Rate limiter unavailable for {self.name}, not throttling: {e}")
+
+        try:
+            yield
+        except Exception as e:
+            if is_rate_limited(e):
+                try:
+                    await self._adjust("decrease", retry_after_seconds(e) or settings.RATE_LIMIT_DEFAULT_PAUSE_SECONDS)
+                except Exception as redis_error:
+                    logger.warning(f"Could not lower the rate of {self.name}: {redis_error}")
+            raise
+        else:
+            try:
+                await self._adjust("increase")
+            except Exception as e:
+                logger.warning(f"Could not raise the rate of {self.name}: {e}")
+        finally:
+            if lease_id is not None:
+                try:
+                    await get_redis().zrem(self.leases_key, lease_id)
+                except Exception as e:
+                    # The lease expires on its own
+                    logger.warning(f"Could not release {self.name} concurrency slot: {e}")
+
+
+_governors: dict[str, ProviderGovernor] = {}
+
+
+def provider_slot(provider: str, model: str):
+    """`async with provider_slot(provider, model):` around every call to a model provider."""
+    key = f"{provider}/{model}"
+    governor = _governors.get(key)
+    if governor is None:
+        governor = _governors[key] = ProviderGovernor(provider, model)
+    return governor.slot()
@@ -0,0 +1,20 @@
+import asyncio
+import weakref
+
+from redis.asyncio import Redis
+
+from app.core.config import settings
+
+# One client (and connection pool) per event loop: asyncio connections cannot be
+# shared across loops, and the worker may run jobs on more than one loop.
+_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Redis]" = weakref.WeakKeyDictionary()
+
+
+def get_redis() -> Redis:
+    """Returns the shared async Redis client for the running event loop."""
+    loop = asyncio.get_running_loop()
+    client = _clients.get(loop)
+    if client is None:
+        client = Redis.from_url(settings.REDIS_URL, decode_responses=True)
+        _clients[loop] = client
+    return client
@@ -0,0 +1,132 @@
+import hashlib
+import logging
+from typing import Awaitable, Callable
+
+from fastapi import Request, Response
+from sqlalchemy import select
+
+from app.core.config import settings
+from app.services.redis_client import get_redis
+
+logger = logging.getLogger(__name__)
+
+# Property and room detail responses are cached per property version. Any
+# change that can alter what those views show (rooms, images, thumbnails,
+# completed or deleted jobs) bumps the version, which invalidates the cached
+# bodies and the ETags clients hold in one INCR. Stale bodies are never
+# deleted; they simply stop being addressed and expire.
+#
+# Redis is only an accelerator: if it cannot be read, responses are built
+# from Postgres uncached. A bump that fails leaves the old body addressed
+# until it expires, so RESPONSE_CACHE_TTL_SECONDS bounds how stale a view can
+# get; ETags carry a hash of the body, so a rebuilt body never matches an
+# ETag issued for the stale one.
+
+
+def _version_key(property_id) -> str:
+    return f"property:{property_id}:version"
+
+
+def _room_property_key(room_id) -> str:
+    return f"room:{room_id}:property"
+
+
+async def get_property_version(property_id) -> int | None:
+    """The property's response version, or None if Redis cannot be read."""
+    try:
+        return int(await get_redis().get(_version_key(property_id)) or 0)
+    except Exception as e:
+        logger.warning(f"Could not read version of property {property_id}: {e}")
+        return None
+
+
+async def bump_property_version(property_id):
+    """Invalidates every cached response of a property. Failures are logged only."""
+    try:
+        await get_redis().incr(_version_key(property_id))
+    except Exception as e:
+        logger.warning(f"Could not bump version of property {property_id}: {e}")
+
+
+async def room_property_id(db, room_id):
+    """
+    The property a room belongs to. Rooms never move between properties, so
+    the mapping is cached in Redis once read. Returns None for unknown rooms.
+    """
+    redis = get_redis()
+    try:
+        cached = await redis.get(_room_property_key(room_id))
+    except Exception as e:
+        logger.warning(f"Could not read cached property of room {room_id}: {e}")
+        cached = None
+    if cached:
+        return cached
+
+    from app.models.room import Room
+    property_id = (await db.execute(select(Room.property_id).where(Room.id == room_id))).scalar_one_or_none()
+    if property_id is not None:
+        property_id = str(property_id)
+        try:
+            await redis.set(_room_property_key(room_id), property_id, ex=settings.RESPONSE_CACHE_TTL_SECONDS)
+        except Exception as e:
+            logger.warning(f"Could not cache property of room {room_id}: {e}")
+    return property_id
+
+
+async def bump_room_version(db, room_id):
+    """Invalidates the cached responses of the property the room belongs to."""
+    if room_id is None:
+        return
+    try:
+        property_id = await room_property_id(db, room_id)
+    except Exception as e:
+        logger.warning(f"Could not resolve property of room {room_id}: {e}")
+        return
+    if property_id is not None:
+        await bump_property_version(property_id)
+
+
+def _etag_matches(request: Request, etag: str) -> bool:
+    if_none_match = request.headers.get("if-none-match")
+    if not if_none_match:
+        return False
+    candidates = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+    return etag in candidates or "*" in candidates
+
+
+async def cached_response(
+    request: Request,
+    cache_key: str,
+    version: int | None,
+    build: Callable[[], Awaitable[str]],
+) -> Response:
+    """
+    Serves a JSON response for `cache_key` at the given version: the cached
+    body when one exists, otherwise the body returned by `build` (which is
+    then cached), or 304 when the client already holds that body. The version
+    must be read before `build` queries the database, so a concurrent bump can
+    only make the cached body newer than its version, never older. Without a
+    version (Redis unavailable) the body is built and served uncached.
+    """
+    if version is None:
+        return Response(content=await build(), media_type="application/json")
+
+    redis = get_redis()
+    body_key = f"response:{cache_key}:v{version}"
+    try:
+        body = await redis.get(body_key)
+    except Exception as e:
+        logger.warning(f"Could not read cached response {cache_key}: {e}")
+        return Response(content=await build(), media_type="application/json")
+    if body is None:
+        body = await build()
+        try:
+            await redis.set(body_key, body, ex=settings.RESPONSE_CACHE_TTL_SECONDS)
+        except Exception as e:
+            logger.warning(f"Could not cache response {cache_key}: {e}")
+
+    etag = f'"{cache_key}.v{version}.{hashlib.sha1(body.encode()).hexdigest()[:16]}"'
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+    if _etag_matches(request, etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
@@ -1,14 +1,115 @@
+import asyncio
+import io
 import json
+import logging
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
 import boto3
+import urllib3
 from botocore.config import Config
 from app.core.config import settings
 from minio import Minio
 
-class S3StorageService:
+logger = logging.getLogger(__name__)
+
+class ThreadedStorageMixin:
+    """
+    Runs the blocking boto3/minio calls on a dedicated thread pool so coroutines
+    never stall the event loop. The pool size doubles as the concurrency limit
+    and matches the HTTP connection pool of the underlying client.
+    """
+    max_concurrency = settings.STORAGE_MAX_CONCURRENCY
+
+    def _init_executor(self):
+        self._executor = ThreadPoolExecutor(
+            max_workers=self.max_concurrency,
+            thread_name_prefix="storage",
+        )
+
+    async def _run(self, func, *args, **kwargs):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, partial(func, *args, **kwargs))
+
+class S3MultipartUpload:
+    """
+    Streams an object into S3 as a multipart upload. Only the current part is
+    held in memory, so memory use is bounded by the part size rather than the
+    object size. Objects smaller than one part fall back to a single put.
+    """
+
+    def __init__(self, service: "S3StorageService", bucket: str, object_name: str, content_type: str):
+        self.service = service
+        self.bucket = bucket
+        self.object_name = object_name
+        self.content_type = content_type
+        self.part_size = settings.STORAGE_MULTIPART_PART_SIZE
+        self._buffer = bytearray()
+        self._upload_id = None
+        self._parts = []
+
+    async def write(self, chunk: bytes):
+        self._buffer += chunk
+        while len(self._buffer) >= self.part_size:
+            part = bytes(self._buffer[:self.part_size])
+            del self._buffer[:self.part_size]
+            await self._upload_part(part)
+
+    async def _upload_part(self, data: bytes):
+        client = self.service.client
+        if self._upload_id is None:
+            response = await self.service._run(
+                client.create_multipart_upload,
+                Bucket=self.bucket,
+                Key=self.object_name,
+                ContentType=self.content_type,
+            )
+            self._upload_id = response['UploadId']
+
+        part_number = len(self._parts) + 1
+        response = await self.service._run(
+            client.upload_part,
+            Bucket=self.bucket,
+            Key=self.object_name,
+            UploadId=self._upload_id,
+            PartNumber=part_number,
+            Body=data,
+        )
+        self._parts.append({"ETag": response['ETag'], "PartNumber": part_number})
+
+    async def complete(self) -> str:
+        if self._upload_id is None:
+            return await self.service.upload_file(self.bucket, self.object_name, bytes(self._buffer), self.content_type)
+
+        if self._buffer:
+            await self._upload_part(bytes(self._buffer))
+            self._buffer.clear()
+        await self.service._run(
+            self.service.client.complete_multipart_upload,
+            Bucket=self.bucket,
+            Key=self.object_name,
+            UploadId=self._upload_id,
+            MultipartUpload={"Parts": self._parts},
+        )
+        return self.service.get_url(self.bucket, self.object_name)
+
+    async def abort(self):
+        self._buffer.clear()
+        if self._upload_id is not None:
+            await self.service._run(
+                self.service.client.abort_multipart_upload,
+                Bucket=self.bucket,
+                Key=self.object_name,
+                UploadId=self._upload_id,
+            )
+
+class S3StorageService(ThreadedStorageMixin):
     def __init__(self):
+        self._init_executor()
         boto_config = Config(
             signature_version='s3v4',
             region_name=settings.STORAGE_REGION,
+            max_pool_connections=self.max_concurrency,
         )
 
         if settings.STORAGE_USE_IAM:
@@ -32,8 +133,9 @@ class S3StorageService:
             )
 
     async def upload_file(self, bucket: str, object_name: str, data: bytes, content_type: str):
-        print(f"Uploading to bucket: {bucket}, object: {object_name}, content_type: {content_type}")
-        self.client.put_object(
+        logger.debug(f"Uploading to bucket: {bucket}, object: {object_name}, content_type: {content_type}")
+        await self._run(
+            self.client.put_object,
             Bucket=bucket,
             Key=object_name,
             Body=data,
@@ -41,8 +143,13 @@ class S3StorageService:
         )
         return self.get_url(bucket, object_name)
 
+    def open_upload(self, bucket: str, object_name: str, content_type: str) -> S3MultipartUpload:
+        """Starts a streaming upload; write() chunks, then complete() or abort()."""
+        logger.info(f"Streaming upload to bucket: {bucket}, object: {object_name}, content_type: {content_type}")
+        return S3MultipartUpload(self, bucket, object_name, content_type)
+
     async def delete_file(self, bucket: str, object_name: str):
-        self.client.delete_object(Bucket=bucket, Key=object_name)
+        await self._run(self.client.delete_object, Bucket=bucket, Key=object_name)
         
     def get_protocol(self):
         return "https" if settings.STORAGE_USE_SSL else "http"
@@ -50,18 +157,68 @@ class S3StorageService:
     def get_url(self, bucket: str, object_name: str):
         return f"{self.get_protocol()}://{settings.STORAGE_PUBLIC_ENDPOINT}/{bucket}/{object_name}"
 
-    def get_object_data(self, bucket: str, object_name: str) -> bytes:
-        """Retrieves object data from S3."""
+    def _get_object_data(self, bucket: str, object_name: str) -> bytes:
         response = self.client.get_object(Bucket=bucket, Key=object_name)
         return response['Body'].read()
+
+    async def get_object_data(self, bucket: str, object_name: str) -> bytes:
+        """Retrieves object data from S3."""
+        return await self._run(self._get_object_data, bucket, object_name)
+
+    async def get_object_etag(self, bucket: str, object_name: str) -> str:
+        """Retrieves the object's ETag without downloading it."""
+        response = await self._run(self.client.head_object, Bucket=bucket, Key=object_name)
+        return response['ETag']
     
-class MinioStorageService:
+class MinioSpooledUpload:
+    """
+    Streaming upload for MinIO. Chunks are spooled to a temporary file (in memory
+    only up to one part) and handed to put_object, which uploads in parts.
+    """
+
+    def __init__(self, service: "MinioStorageService", bucket: str, object_name: str, content_type: str):
+        self.service = service
+        self.bucket = bucket
+        self.object_name = object_name
+        self.content_type = content_type
+        self._spool = tempfile.SpooledTemporaryFile(max_size=settings.STORAGE_MULTIPART_PART_SIZE)
+        self._length = 0
+
+    async def write(self, chunk: bytes):
+        await self.service._run(self._spool.write, chunk)
+        self._length += len(chunk)
+
+    async def complete(self) -> str:
+        try:
+            self._spool.seek(0)
+            await self.service._run(
+                self.service.client.put_object,
+                self.bucket,
+                self.object_name,
+                self._spool,
+                length=self._length,
+                content_type=self.content_type,
+                part_size=max(settings.STORAGE_MULTIPART_PART_SIZE, 5 * 1024 * 1024),
+            )
+        finally:
+            self._spool.close()
+        return self.service.get_url(self.bucket, self.object_name)
+
+    async def abort(self):
+        self._spool.close()
+
+class MinioStorageService(ThreadedStorageMixin):
     def __init__(self):
+        self._init_executor()
         self.client = Minio(
             settings.STORAGE_ENDPOINT,
             access_key=settings.STORAGE_ACCESS_KEY,
             secret_key=settings.STORAGE_SECRET_KEY,
-            secure=settings.STORAGE_USE_SSL
+            secure=settings.STORAGE_USE_SSL,
+            http_client=urllib3.PoolManager(
+                maxsize=self.max_concurrency,
+                retries=urllib3.Retry(total=3, backoff_factor=0.2, status_forcelist=[500, 502, 503, 504]),
+            ),
         )
         self._ensure_buckets()
 
@@ -93,7 +250,8 @@ class MinioStorageService:
 
     async def upload_file(self, bucket: str, object_name: str, data: bytes, content_type: str):
         data_stream = io.BytesIO(data)
-        self.client.put_object(
+        await self._run(
+            self.client.put_object,
             bucket,
             object_name,
             data_stream,
@@ -102,8 +260,12 @@ class MinioStorageService:
         )
         return self.get_url(bucket, object_name)
 
+    def open_upload(self, bucket: str, object_name: str, content_type: str) -> MinioSpooledUpload:
+        """Starts a streaming upload; write() chunks, then complete() or abort()."""
+        return MinioSpooledUpload(self, bucket, object_name, content_type)
+
     async def delete_file(self, bucket: str, object_name: str):
-        self.client.remove_object(bucket, object_name)
+        await self._run(self.client.remove_object, bucket, object_name)
         
     def get_protocol(self):
         return "http"
@@ -113,10 +275,7 @@ class MinioStorageService:
         # For now, returning a direct URL. In production, this would be a signed URL or CDN URL.
         return f"{self.get_protocol()}://{settings.STORAGE_PUBLIC_ENDPOINT}/{bucket}/{object_name}"
 
-    def get_object_data(self, bucket: str, object_name: str) -> bytes:
-        """
-        Retrieves object data from MinIO.
-        """
+    def _get_object_data(self, bucket: str, object_name: str) -> bytes:
         response = None
         try:
             response = self.client.get_object(bucket, object_name)
@@ -126,5 +285,18 @@ class MinioStorageService:
                 response.close()
                 response.release_conn()
 
+    async def get_object_data(self, bucket: str, object_name: str) -> bytes:
+        """
+        Retrieves object data from MinIO.
+        """
+        return await self._run(self._get_object_data, bucket, object_name)
+
+    async def get_object_etag(self, bucket: str, object_name: str) -> str:
+        """
+        Retrieves the object's ETag from MinIO without downloading it.
+        """
+        stat = await self._run(self.client.stat_object, bucket, object_name)
+        return stat.etag
+
 
 storage_service = S3StorageService() if settings.STORAGE_REGION else MinioStorageService()
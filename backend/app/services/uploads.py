@@ -0,0 +1,199 @@
+import hashlib
+import io
+import logging
+import uuid
+from dataclasses import dataclass, field
+
+from fastapi import Request
+from multipart.multipart import MultipartParser, parse_options_header
+from PIL import Image
+
+from app.services.image_processing import EXIF_ORIENTATION_TAG
+from app.services.image_service import media_type_for_format
+from app.services.storage import storage_service
+
+logger = logging.getLogger(__name__)
+
+# Give up on reading dimensions if the header has not been parsed after this many bytes
+MAX_HEADER_PROBE_BYTES = 1024 * 1024
+# Non-file form fields are tiny (e.g. room_id); cap them so they cannot be used to buffer a body
+MAX_FIELD_BYTES = 64 * 1024
+
+
+def _header_orientation(img: Image.Image) -> int:
+    """
+    EXIF orientation from the metadata Image.open already parsed (JPEG APP1,
+    WebP/PNG EXIF chunks, TIFF IFD). Never calls getexif(): for a PNG without
+    an eXIf chunk that loads, i.e. decodes, the whole image.
+    """
+    try:
+        raw = img.info.get("exif")
+        if raw:
+            exif = Image.Exif()
+            exif.load(raw)
+            return exif.get(EXIF_ORIENTATION_TAG, 1)
+        tags = getattr(img, "tag_v2", None)
+        if tags is not None:
+            return tags.get(EXIF_ORIENTATION_TAG, 1)
+    except Exception as e:
+        logger.warning(f"Could not read EXIF orientation: {e}")
+    return 1
+
+
+class ImageHeaderProbe:
+    """
+    Reads width, height, format and EXIF orientation from the leading bytes of an image.
+    Pillow only parses the header in Image.open, so no pixels are decoded and
+    only the first few KB of the stream are retained.
+    """
+
+    def __init__(self):
+        self._head = bytearray()
+        self.done = False
+        self.width: int | None = None
+        self.height: int | None = None
+        self.format: str | None = None
+        self.orientation: int | None = None
+
+    def feed(self, chunk: bytes):
+        if self.done:
+            return
+        self._head += chunk
+        try:
+            with Image.open(io.BytesIO(self._head)) as img:
+                self.width, self.height = img.size
+                self.format = img.format
+                self.orientation = _header_orientation(img)
+            self.done = True
+        except Exception:
+            if len(self._head) >= MAX_HEADER_PROBE_BYTES:
+                logger.warning("Could not read image header within probe limit")
+                self.done = True
+        if self.done:
+            self._head = bytearray()
+
+
+@dataclass
+class StreamedUpload:
+    url: str
+    object_name: str
+    filename: str
+    content_type: str
+    size: int
+    content_hash: str
+    width: int | None = None
+    height: int | None = None
+    image_format: str | None = None
+    orientation: int | None = None
+    fields: dict[str, str] = field(default_factory=dict)
+
+
+async def stream_image_upload(request: Request, bucket: str, field_name: str = "file") -> StreamedUpload:
+    """
+    Streams the multipart request body straight into storage. The file part is
+    forwarded chunk by chunk while its size, SHA-256 and header dimensions are
+    computed on the way, so memory stays constant regardless of file size.
+    Raises ValueError for malformed requests or a missing file part.
+    """
+    content_type, params = parse_options_header(request.headers.get("content-type", ""))
+    boundary = params.get(b"boundary")
+    if content_type != b"multipart/form-data" or not boundary:
+        raise ValueError("Expected a multipart/form-data request")
+
+    messages: list[tuple[str, bytes]] = []
+    callbacks = {
+        "on_part_begin": lambda: messages.append(("part_begin", b"")),
+        "on_part_data": lambda data, start, end: messages.append(("part_data", data[start:end])),
+        "on_part_end": lambda: messages.append(("part_end", b"")),
+        "on_header_field": lambda data, start, end: messages.append(("header_field", data[start:end])),
+        "on_header_value": lambda data, start, end: messages.append(("header_value", data[start:end])),
+        "on_header_end": lambda: messages.append(("header_end", b"")),
+        "on_headers_finished": lambda: messages.append(("headers_finished", b"")),
+    }
+    parser = MultipartParser(boundary, callbacks)
+
+    upload = None
+    result = None
+    hasher = hashlib.sha256()
+    probe = ImageHeaderProbe()
+    size = 0
+    fields: dict[str, str] = {}
+
+    header_field = b""
+    header_value = b""
+    headers: dict[bytes, bytes] = {}
+    part_name = None
+    part_is_file = False
+    field_value = bytearray()
+
+    try:
+        async for chunk in request.stream():
+            parser.write(chunk)
+            for message_type, data in messages:
+                if message_type == "part_begin":
+                    headers = {}
+                    part_name = None
+                    part_is_file = False
+                    field_value = bytearray()
+                elif message_type == "header_field":
+                    header_field += data
+                elif message_type == "header_value":
+                    header_value += data
+                elif message_type == "header_end":
+                    headers[header_field.lower()] = header_value
+                    header_field = b""
+                    header_value = b""
+                elif message_type == "headers_finished":
+                    _, disposition = parse_options_header(headers.get(b"content-disposition", b""))
+                    part_name = disposition.get(b"name", b"").decode("latin-1")
+                    filename = disposition.get(b"filename")
+                    if part_name == field_name and filename is not None and upload is None:
+                        part_is_file = True
+                        filename = filename.decode("utf-8", errors="replace")
+                        part_content_type = headers.get(b"content-type", b"application/octet-stream").decode("latin-1")
+                        object_name = f"{uuid.uuid4()}.{filename.split('.')[-1]}"
+                        upload = storage_service.open_upload(bucket, object_name, part_content_type)
+                        result = StreamedUpload(
+                            url="",
+                            object_name=object_name,
+                            filename=filename,
+                            content_type=part_content_type,
+                            size=0,
+                            content_hash="",
+                        )
+                elif message_type == "part_data":
+                    if part_is_file:
+                        size += len(data)
+                        hasher.update(data)
+                        probe.feed(data)
+                        await upload.write(data)
+                    elif part_name is not None and len(field_value) + len(data) <= MAX_FIELD_BYTES:
+                        field_value += data
+                elif message_type == "part_end":
+                    if part_is_file:
+                        part_is_file = False
+                    elif part_name:
+                        fields[part_name] = field_value.decode("utf-8", errors="replace")
+            messages.clear()
+        parser.finalize()
+
+        if upload is None:
+            raise ValueError(f"Missing file field '{field_name}'")
+
+        result.url = await upload.complete()
+    except BaseException:
+        if upload is not None:
+            try:
+                await upload.abort()
+            except Exception as e:
+                logger.error(f"Error aborting streamed upload: {e}")
+        raise
+
+    result.size = size
+    result.content_hash = hasher.hexdigest()
+    result.width = probe.width
+    result.height = probe.height
+    result.image_format = media_type_for_format(probe.format)
+    result.orientation = probe.orientation
+    result.fields = fields
+    return result
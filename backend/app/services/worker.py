@@ -1,18 +1,191 @@
-from redis import Redis
-from rq import Queue
+import argparse
+import asyncio
+import logging
+import signal
+import socket
+import uuid
+
 from app.core.config import settings
+from app.services.http_client import close_http_client
+from app.services.job_queue import (
+    HEARTBEAT_KEY,
+    PROCESSING_KEY,
+    WORKERS_KEY,
+    adopt_rq_queue,
+    complete,
+    dequeue,
+    discard,
+    release_held_jobs,
+    requeue_processing,
+)
+from app.services.redis_client import get_redis
+
+logger = logging.getLogger(__name__)
+
+class StagingWorker:
+    """
+    Long-lived asyncio worker: consumes the staging queue and runs up to
+    `concurrency` jobs at once on one persistent event loop, so the database
+    pool, Redis/HTTP clients and model clients stay warm across jobs.
+    """
+
+    def __init__(self, concurrency: int = settings.WORKER_CONCURRENCY):
+        self.concurrency = concurrency
+        self.worker_id = f"{socket.gethostname()}:{uuid.uuid4().hex[:8]}"
+        self.processing_key = PROCESSING_KEY.format(worker_id=self.worker_id)
+        self.heartbeat_key = HEARTBEAT_KEY.format(worker_id=self.worker_id)
+        self._slots = asyncio.Semaphore(concurrency)
+        self._stopping = asyncio.Event()
+        self._tasks: set[asyncio.Task] = set()
+
+    def stop(self):
+        if not self._stopping.is_set():
+            logger.info(f"Worker {self.worker_id} shutting down, waiting for {len(self._tasks)} running job(s)")
+            self._stopping.set()
+
+    async def run(self):
+        # Import the pipeline (and all models) once, up front
+        import app.models  # noqa: F401
+        from app.services.model_clients import warm_up_model_clients
+
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGTERM, signal.SIGINT):
+            loop.add_signal_handler(sig, self.stop)
+
+        redis = get_redis()
+        await redis.sadd(WORKERS_KEY, self.worker_id)
+        await self._beat()
+        heartbeat = asyncio.create_task(self._heartbeat_loop())
+        await self.recover_orphaned_jobs()
+        if adopted := await adopt_rq_queue():
+            logger.info(f"Moved {adopted} job(s) from the RQ queue into the bulk lane")
+        await warm_up_model_clients()
+
+        logger.info(f"Worker {self.worker_id} consuming the staging queue with concurrency {self.concurrency}")
+        try:
+            while not self._stopping.is_set():
+                if not await self._acquire_slot():
+                    break
+                taken = await self._dequeue()
+                if taken is None:
+                    self._slots.release()
+                    continue
+                job_id, lane, waited = taken
+                logger.info(f"Starting job {job_id} from the {lane} lane after {waited:.1f}s in queue")
+                task = asyncio.create_task(self._run_job(job_id))
+                self._tasks.add(task)
+                task.add_done_callback(self._tasks.discard)
+        finally:
+            await self._drain()
+            heartbeat.cancel()
+            # Jobs the drain cancelled go back on the queue now: once deregistered, no other
+            # worker would ever look at our processing list
+            if requeued := await self._requeue(self.worker_id):
+                logger.warning(f"Requeued {requeued} job(s) interrupted by shutdown")
+            await redis.srem(WORKERS_KEY, self.worker_id)
+            await redis.delete(self.heartbeat_key)
+            from app.services.progress import progress_writer
+            await progress_writer.close()
+            await close_http_client()
+
+    async def _acquire_slot(self) -> bool:
+        """Waits for a free job slot; returns False if the worker is asked to stop first."""
+        acquire = asyncio.ensure_future(self._slots.acquire())
+        stopping = asyncio.ensure_future(self._stopping.wait())
+        await asyncio.wait({acquire, stopping}, return_when=asyncio.FIRST_COMPLETED)
+        stopping.cancel()
+        if not self._stopping.is_set():
+            return True
+        acquire.cancel()
+        await asyncio.gather(acquire, return_exceptions=True)
+        if not acquire.cancelled():
+            self._slots.release()
+        return False
+
+    async def _dequeue(self) -> tuple[str, str, float] | None:
+        if self._stopping.is_set():
+            return None
+        # Short blocking timeout so shutdown is noticed promptly
+        return await dequeue(self.processing_key, timeout=1)
+
+    async def _run_job(self, job_id: str):
+        from app.services.generation import _process_staging_job_async, mark_job_failed
+
+        try:
+            try:
+                ran = await asyncio.wait_for(_process_staging_job_async(job_id), settings.STAGING_JOB_TIMEOUT_SECONDS)
+            except asyncio.TimeoutError:
+                logger.error(f"Job {job_id} timed out after {settings.STAGING_JOB_TIMEOUT_SECONDS}s")
+                ran = await mark_job_failed(job_id, "Job timed out")
+            except Exception as e:
+                logger.exception(f"Unhandled error in job {job_id}: {e}")
+                ran = await mark_job_failed(job_id, str(e))
+            # Not reached when cancelled on shutdown: the job has no outcome. Its id stays in our processing
+            # list to be requeued before we deregister, and its dependents keep waiting
+            if ran:
+                await complete(self.processing_key, job_id)
+            else:
+                await discard(self.processing_key, job_id)
+        finally:
+            self._slots.release()
+
+    async def _drain(self):
+        if not self._tasks:
+            return
+        done, pending = await asyncio.wait(set(self._tasks), timeout=settings.WORKER_SHUTDOWN_TIMEOUT_SECONDS)
+        for task in pending:
+            # Left in our processing list; run() requeues them before deregistering
+            task.cancel()
+        await asyncio.gather(*pending, return_exceptions=True)
+
+    async def _beat(self):
+        await get_redis().set(self.heartbeat_key, "1", ex=settings.WORKER_HEARTBEAT_TTL_SECONDS)
+
+    async def _heartbeat_loop(self):
+        while True:
+            await asyncio.sleep(settings.WORKER_HEARTBEAT_TTL_SECONDS / 3)
+            try:
+                await self._beat()
+                await self.recover_orphaned_jobs()
+                await release_held_jobs()
+            except Exception as e:
+                logger.warning(f"Worker heartbeat failed: {e}")
+
+    async def _requeue(self, worker_id: str) -> int:
+        """
+        Puts the jobs left in a worker's processing list back on the queue,
+        after moving their rows from in_progress back to queued: a claim only
+        takes queued jobs, so a duplicate entry never runs a live job twice.
+        """
+        from app.services.generation import reset_interrupted_job
+
+        for job_id in await get_redis().lrange(PROCESSING_KEY.format(worker_id=worker_id), 0, -1):
+            await reset_interrupted_job(job_id)
+        return await requeue_processing(worker_id)
+
+    async def recover_orphaned_jobs(self):
+        """Requeues jobs held by workers whose heartbeat has expired."""
+        redis = get_redis()
+        for worker_id in await redis.smembers(WORKERS_KEY):
+            if worker_id == self.worker_id or await redis.exists(HEARTBEAT_KEY.format(worker_id=worker_id)):
+                continue
+            requeued = await self._requeue(worker_id)
+            if requeued:
+                logger.warning(f"Requeued {requeued} job(s) from dead worker {worker_id}")
+            await redis.srem(WORKERS_KEY, worker_id)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="StageMasterAI staging worker")
+    parser.add_argument("--concurrency", type=int, default=settings.WORKER_CONCURRENCY)
+    args = parser.parse_args()
+
+    # Must happen before app.models is imported: the engine picks its pool profile from it
+    settings.PROCESS_ROLE = "worker"
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+    asyncio.run(StagingWorker(concurrency=args.concurrency).run())
+
 
-redis_conn = Redis.from_url(settings.REDIS_URL)
-job_queue = Queue("staging", connection=redis_conn)
-
-def queue_staging_job(job_id: str):
-    print(f"Queueing staging job with ID: {job_id}")
-    # This will be imported in the routes to queue a job
-    from app.services.generation import process_staging_job
-    job = job_queue.enqueue(
-        process_staging_job,
-        job_id,
-        job_timeout="5m",
-        result_ttl=86400
-    )
-    return job
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+"""
+Query-plan check for the hot query paths.
+
+Runs EXPLAIN on the queries the API and the worker issue on every request/job
+and verifies that each one is served by the index an alembic revision
+created for it. Sequential scans are disabled for the session, so the check
+proves the index is usable even on a small development database where the
+planner would rightly prefer a scan.
+
+Usage (from backend/, against DATABASE_URL):
+
+    python -m scripts.check_query_plans
+
+Exits with status 1 if any query does not use its expected index.
+"""
+import asyncio
+import json
+import sys
+import uuid
+from datetime import datetime
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import create_async_engine
+
+from app.core.config import settings
+
+_ID = uuid.uuid4()
+_NOW = datetime.utcnow()
+
+# (description, SQL, parameters, expected index)
+CHECKS = (
+    (
+        "latest completed job of a reference image",
+        "SELECT id FROM jobs WHERE image_id = :id AND status = 'completed' ORDER BY created_at DESC LIMIT 1",
+        {"id": _ID},
+        "ix_jobs_image_id_status_created_at",
+    ),
+    (
+        "jobs of an image (Image.jobs)",
+        "SELECT id FROM jobs WHERE image_id = ANY(:ids) ORDER BY created_at DESC",
+        {"ids": [_ID]},
+        "ix_jobs_image_id_status_created_at",
+    ),
+    (
+        "job list, next page",
+        "SELECT id FROM jobs WHERE (created_at, id) < (:created_at, :id) ORDER BY created_at DESC, id DESC LIMIT 51",
+        {"created_at": _NOW, "id": _ID},
+        "ix_jobs_created_at_id",
+    ),
+    (
+        "job list filtered by user",
+        "SELECT id FROM jobs WHERE user_id = :id ORDER BY created_at DESC, id DESC LIMIT 51",
+        {"id": _ID},
+        "ix_jobs_user_id_created_at_id",
+    ),
+    (
+        "job list filtered by room",
+        "SELECT id FROM jobs WHERE room_id = :id ORDER BY created_at DESC, id DESC LIMIT 51",
+        {"id": _ID},
+        "ix_jobs_room_id_created_at_id",
+    ),
+    (
+        "job list filtered by status",
+        "SELECT id FROM jobs WHERE status = 'completed' ORDER BY created_at DESC, id DESC LIMIT 51",
+        {},
+        "ix_jobs_status_created_at_id",
+    ),
+    (
+        "oldest image of a room",
+        "SELECT id FROM images WHERE room_id = :id ORDER BY created_at ASC LIMIT 1",
+        {"id": _ID},
+        "ix_images_room_id_created_at",
+    ),
+    (
+        "rooms of a property (Property.rooms)",
+        "SELECT id FROM rooms WHERE property_id = :id",
+        {"id": _ID},
+        "ix_rooms_property_id",
+    ),
+    (
+        "room of a reference image",
+        "SELECT id FROM rooms WHERE reference_image_id = :id",
+        {"id": _ID},
+        "ix_rooms_reference_image_id",
+    ),
+    (
+        "properties of a user",
+        "SELECT id FROM properties WHERE user_id = :id",
+        {"id": _ID},
+        "ix_properties_user_id",
+    ),
+    (
+        "dependents of a deleted job (ON DELETE SET NULL)",
+        "SELECT id FROM jobs WHERE depends_on_job_id = :id",
+        {"id": _ID},
+        "ix_jobs_depends_on_job_id",
+    ),
+)
+
+
+def _index_names(plan: dict) -> set[str]:
+    names = {plan["Index Name"]} if "Index Name" in plan else set()
+    for child in plan.get("Plans", []):
+        names |= _index_names(child)
+    return names
+
+
+async def main() -> int:
+    engine = create_async_engine(settings.DATABASE_URL)
+    failures = 0
+    try:
+        async with engine.connect() as conn:
+            await conn.execute(text("SET enable_seqscan = off"))
+            for description, sql, params, expected in CHECKS:
+                result = await conn.execute(text(f"EXPLAIN (FORMAT JSON) {sql}"), params)
+                plan = result.scalar()
+                if isinstance(plan, str):
+                    plan = json.loads(plan)
+                used = _index_names(plan[0]["Plan"])
+                ok = expected in used
+                failures += not ok
+                print(f"{'ok  ' if ok else 'FAIL'} {description}: expected {expected}, used {sorted(used) or 'no index'}")
+    finally:
+        await engine.dispose()
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
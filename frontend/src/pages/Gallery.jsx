@@ -7,12 +7,15 @@ import api from '../services/api';
 const Gallery = () => {
     const [jobs, setJobs] = useState([]);
     const [isLoading, setIsLoading] = useState(true);
+    const [nextCursor, setNextCursor] = useState(null);
+    const [isLoadingMore, setIsLoadingMore] = useState(false);
 
     useEffect(() => {
         const fetchJobs = async () => {
             try {
                 const response = await api.get('/jobs');
                 setJobs(response.data.jobs || []);
+                setNextCursor(response.data.next_cursor);
             } catch (e) {
                 console.error("Failed to fetch jobs");
             } finally {
@@ -22,6 +25,19 @@ const Gallery = () => {
         fetchJobs();
     }, []);
 
+    const handleLoadMore = async () => {
+        setIsLoadingMore(true);
+        try {
+            const response = await api.get('/jobs', { params: { cursor: nextCursor } });
+            setJobs(prevJobs => [...prevJobs, ...(response.data.jobs || [])]);
+            setNextCursor(response.data.next_cursor);
+        } catch (e) {
+            console.error("Failed to fetch more jobs");
+        } finally {
+            setIsLoadingMore(false);
+        }
+    };
+
     const handleDelete = async (e, jobId) => {
         // Prevent clicking the parent Link
         e.preventDefault();
@@ -126,7 +142,7 @@ const Gallery = () => {
                                 <div className="aspect-[4/3] bg-surface-container relative overflow-hidden">
                                     {job.result_url ? (
                                         <img
-                                            src={job.result_url}
+                                            src={job.thumbnails?.md ?? job.result_url}
                                             alt={job.room_type}
                                             className="w-full h-full object-cover transition-transform duration-500 group-hover:scale-105"
                                         />
@@ -174,6 +190,19 @@ const Gallery = () => {
                         ))}
                     </div>
                 )}
+
+                {!isLoading && nextCursor && (
+                    <div className="flex justify-center mt-10">
+                        <button
+                            onClick={handleLoadMore}
+                            disabled={isLoadingMore}
+                            className="inline-flex items-center gap-2 bg-surface border border-outline-variant hover:border-accent/50 text-primary px-5 py-2.5 rounded-xl font-medium transition-all disabled:opacity-60"
+                        >
+                            {isLoadingMore && <Loader2 size={16} className="animate-spin" />}
+                            Load more
+                        </button>
+                    </div>
+                )}
             </main>
         </div>
     );
@@ -1,33 +1,26 @@
 import React, { useState, useEffect } from 'react';
-import { useParams, Link, useNavigate, useLocation } from 'react-router-dom';
+import { useParams, Link, useLocation } from 'react-router-dom';
 import { ArrowLeft, Download, Info, Zap, ShieldCheck, RefreshCw, Loader2 } from 'lucide-react';
 import Header from '../components/Common/Header';
 import RenderingProgress from '../components/Staging/RenderingProgress';
 import BeforeAfterSlider from '../components/Results/BeforeAfterSlider';
-import { getJobStatus, createStagingJob } from '../services/api';
+import { getJobStatus, retryJob, subscribeToJobEvents } from '../services/api';
 
 const JobDetail = () => {
     const { jobId } = useParams();
-    const navigate = useNavigate();
     const location = useLocation();
     const [job, setJob] = useState(null);
     const [error, setError] = useState(null);
     const [isRetrying, setIsRetrying] = useState(false);
+    const [attempt, setAttempt] = useState(0);
 
     const handleRetry = async () => {
         if (!job) return;
         setIsRetrying(true);
         try {
-            const newJob = await createStagingJob(
-                job.image_id,
-                job.room_type,
-                job.style_preset,
-                {
-                    fixWhiteBalance: job.fix_white_balance,
-                    wallDecorations: job.wall_decorations
-                }
-            );
-            navigate(`/job/${newJob.id}`);
+            // Same job, resumed from its saved analysis/plan; reload to follow its progress again
+            await retryJob(job.id);
+            setAttempt((n) => n + 1);
         } catch (e) {
             console.error("Retry failed:", e);
             alert("Failed to retry staging. Please try again.");
@@ -39,25 +32,34 @@ const JobDetail = () => {
     useEffect(() => {
         setJob(null);
         setError(null);
-        let interval;
-        const fetchStatus = async () => {
+        let unsubscribe = null;
+        let cancelled = false;
+
+        const load = async () => {
             try {
+                // Full job once, then live progress pushed over SSE instead of polling
                 const data = await getJobStatus(jobId);
+                if (cancelled) return;
                 setJob(data);
-                if (data.status === 'completed' || data.status === 'error') {
-                    clearInterval(interval);
-                }
+                if (data.status === 'completed' || data.status === 'error') return;
+
+                unsubscribe = subscribeToJobEvents(
+                    jobId,
+                    (update) => setJob((current) => ({ ...current, ...update })),
+                    () => setError("Lost connection to job progress")
+                );
             } catch (e) {
-                setError("Failed to load job details");
-                clearInterval(interval);
+                if (!cancelled) setError("Failed to load job details");
             }
         };
 
-        fetchStatus();
-        interval = setInterval(fetchStatus, 3000);
+        load();
 
-        return () => clearInterval(interval);
-    }, [jobId]);
+        return () => {
+            cancelled = true;
+            if (unsubscribe) unsubscribe();
+        };
+    }, [jobId, attempt]);
 
     return (
         <div className="min-h-screen bg-surface-dim">
@@ -297,7 +297,9 @@ const RoomDetail = () => {
                         <div className="bg-white rounded-3xl p-6 shadow-elevation-2 border border-accent/20 flex flex-col lg:flex-row gap-8">
                             <div className="lg:w-2/3 aspect-video rounded-2xl overflow-hidden bg-surface-dim relative group">
                                 <img
-                                    src={showStaged[referenceImage.id] && referenceImage.latest_result_url ? referenceImage.latest_result_url : referenceImage.original_url}
+                                    src={showStaged[referenceImage.id] && referenceImage.latest_result_url
+                                        ? (referenceImage.latest_result_thumbnails?.md ?? referenceImage.latest_result_url)
+                                        : (referenceImage.thumbnails?.md ?? referenceImage.original_url)}
                                     alt="Reference"
                                     className="w-full h-full object-cover transition-all duration-500"
                                 />
@@ -359,7 +361,9 @@ const RoomDetail = () => {
                                 <div key={image.id} className="bg-white rounded-2xl overflow-hidden shadow-elevation-1 border border-outline-variant group hover:shadow-elevation-4 transition-all">
                                     <div className="aspect-video relative overflow-hidden">
                                         <img
-                                            src={showStaged[image.id] && image.latest_result_url ? image.latest_result_url : image.original_url}
+                                            src={showStaged[image.id] && image.latest_result_url
+                                                ? (image.latest_result_thumbnails?.md ?? image.latest_result_url)
+                                                : (image.thumbnails?.md ?? image.original_url)}
                                             alt="Room Angle"
                                             className="w-full h-full object-cover group-hover:scale-105 transition-transform duration-500"
                                         />
@@ -439,7 +443,7 @@ const RoomDetail = () => {
                                     {/* Left: Preview & Enhancements */}
                                     <div className="space-y-8">
                                         <div className="aspect-video rounded-2xl overflow-hidden shadow-elevation-2 border border-outline-variant">
-                                            <img src={selectedImage.original_url} alt="To stage" className="w-full h-full object-cover" />
+                                            <img src={selectedImage.thumbnails?.md ?? selectedImage.original_url} alt="To stage" className="w-full h-full object-cover" />
                                         </div>
 
                                         <div className="space-y-4">
@@ -73,4 +73,30 @@ export const getJobStatus = async (jobId) => {
     return response.data;
 };
 
+// Requeues a failed job; it resumes after the stages that already succeeded
+export const retryJob = async (jobId) => {
+    const response = await api.post(`/jobs/${jobId}/retry`);
+    return response.data;
+};
+
+// Subscribes to the job's Server-Sent Events progress stream.
+// Returns a function that closes the stream.
+export const subscribeToJobEvents = (jobId, onEvent, onError) => {
+    const source = new EventSource(`${API_BASE_URL}/jobs/${jobId}/events`);
+    source.addEventListener('progress', (event) => {
+        const data = JSON.parse(event.data);
+        onEvent(data);
+        if (data.status === 'completed' || data.status === 'error') {
+            source.close();
+        }
+    });
+    source.onerror = () => {
+        // EventSource reconnects on its own unless the stream was closed for good
+        if (source.readyState === EventSource.CLOSED && onError) {
+            onError();
+        }
+    };
+    return () => source.close();
+};
+
 export default api;